@@ -16,6 +16,10 @@
 # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 # DEALINGS IN THE SOFTWARE.
 
+import asyncio
+import concurrent.futures
+import os
+import threading
 import time
 import typing
 import bittensor as bt
@@ -24,8 +28,14 @@ import bittensor as bt
 import omega
 
 from omega.base.miner import BaseMinerNeuron
-from omega.imagebind_wrapper import ImageBind
-from omega.miner_utils import search_and_embed_videos
+from omega.embedding_cache import EmbeddingCache
+from omega.imagebind_wrapper import ImageBind, SharedEmbedder, MODEL_VERSION
+from omega.miner_utils import search_and_embed_videos, get_num_search_results
+from omega.protocol import VideoMetadata
+from omega.scrape_scheduler import ScrapeScheduler, AdmissionRejected
+from omega.topic_pool import TopicPool, ServedVideoTracker
+from omega import video_utils
+from omega.video_search import SearchService
 from omega.augment import LocalLLMAugment, OpenAIAugment, NoAugment
 from omega.utils.config import QueryAugment
 from omega.constants import VALIDATOR_TIMEOUT
@@ -52,22 +62,138 @@ class Miner(BaseMinerNeuron):
         else:
             raise ValueError("Invalid query augment")
         self.imagebind = ImageBind()
+        self.embedder = SharedEmbedder(self.imagebind, max_wait=self.config.neuron.embed_batch_wait)
+        self.augment_lock = threading.Lock()
+        self.search_service = SearchService()
+        self.scrape_scheduler = ScrapeScheduler(
+            self.config.neuron.scrape_workers, self.config.neuron.scrape_queue_size
+        )
+        self.embedding_cache = None
+        if self.config.neuron.embedding_cache_size > 0:
+            self.embedding_cache = EmbeddingCache(
+                self.config.neuron.embedding_cache_path or os.path.join(self.config.neuron.full_path, "embedding_cache"),
+                self.config.neuron.embedding_cache_size,
+                MODEL_VERSION,
+            )
+        # Only tracked with the topic pool on, so pooled and freshly scraped videos are not submitted
+        # twice. A tracked video is never resubmitted, so it is also never served from the embedding
+        # cache again: with the pool on, cache hits come from videos harvested but not yet served.
+        self.served_videos = None
+        self.topic_pool = None
+        if self.config.neuron.topic_pool_videos > 0:
+            self.served_videos = ServedVideoTracker()
+            api_root = (
+                "https://dev-validator.api.omega-labs.ai"
+                if self.config.subtensor.network == "test" else
+                "https://validator.api.omega-labs.ai"
+            )
+            self.topic_pool = TopicPool(
+                f"{api_root}/api/topics",
+                self.harvest_topic,
+                lambda: self.scrape_scheduler.busy,
+                self.served_videos,
+                videos_per_topic=self.config.neuron.topic_pool_videos,
+                max_age=self.config.neuron.topic_pool_max_age,
+                max_topics=self.config.neuron.topic_pool_topics,
+            )
+            self.topic_pool.start()
 
     async def forward(
         self, synapse: omega.protocol.Videos
     ) -> omega.protocol.Videos:
         bt.logging.info(f"Received scraping request: {synapse.num_videos} videos for query '{synapse.query}'")
         start = time.time()
-        synapse.video_metadata = search_and_embed_videos(
-            self.augment(synapse.query), synapse.num_videos, self.imagebind
-        )
+        # Stop early enough for the response to reach the validator before it gives up on us.
+        deadline = start + (synapse.timeout or VALIDATOR_TIMEOUT) - self.config.neuron.deadline_margin
+        video_metadata = []
+        if self.topic_pool is not None:
+            video_metadata = self.topic_pool.take(synapse.query, synapse.num_videos)
+            if video_metadata:
+                bt.logging.info(f"Served {len(video_metadata)} videos from the topic pool")
+        num_to_scrape = synapse.num_videos - len(video_metadata)
+        if num_to_scrape > 0:
+            priority = await self.priority(synapse)
+            try:
+                video_metadata += await asyncio.wrap_future(self.scrape_scheduler.submit(
+                    priority, self.scrape, synapse, num_to_scrape, asyncio.get_running_loop(), start, deadline
+                ))
+            except AdmissionRejected as e:
+                bt.logging.warning(f"Dropping scraping request from {synapse.dendrite.hotkey}: {e}")
+        encoding = synapse.select_embedding_encoding()
+        synapse.video_metadata = [video.encode(encoding) for video in video_metadata]
         time_elapsed = time.time() - start
         if len(synapse.video_metadata) == synapse.num_videos and time_elapsed < VALIDATOR_TIMEOUT:
             bt.logging.info(f"–––––– SCRAPING SUCCEEDED: Scraped {len(synapse.video_metadata)}/{synapse.num_videos} videos in {time_elapsed} seconds.")
         else:
             bt.logging.error(f"–––––– SCRAPING FAILED: Scraped {len(synapse.video_metadata)}/{synapse.num_videos} videos in {time_elapsed} seconds.")
+        if self.embedding_cache is not None:
+            bt.logging.info(f"Embedding cache: {self.embedding_cache.stats()}")
+        if self.topic_pool is not None:
+            bt.logging.info(f"Topic pool: {self.topic_pool.stats()}")
         return synapse
 
+    def scrape(
+        self, synapse: omega.protocol.Videos, num_videos: int,
+        loop: asyncio.AbstractEventLoop, start: float, deadline: float,
+    ) -> typing.List[VideoMetadata]:
+        """Runs on a scheduler worker thread; the search runs on the axon's event loop."""
+        stages = {"queued": time.time() - start}
+        if time.time() >= deadline:
+            bt.logging.warning(f"Scraping request waited {stages['queued']:.2f}s in the queue, past its deadline")
+            return []
+        stage_start = time.time()
+        with self.augment_lock:
+            query = self.augment(synapse.query)
+        stages["augment"] = time.time() - stage_start
+        stage_start = time.time()
+        try:
+            results = asyncio.run_coroutine_threadsafe(
+                self.search_service.search(query, self.get_num_search_candidates(num_videos)), loop
+            ).result(timeout=max(deadline - time.time(), 0))
+        except concurrent.futures.TimeoutError:
+            bt.logging.warning("Search did not finish before the scraping deadline")
+            return []
+        stages["search"] = time.time() - stage_start
+        stage_start = time.time()
+        results = self.select_unserved(results, num_videos)
+        video_metadata = search_and_embed_videos(
+            query, num_videos, self.embedder, self.embedding_cache, results=results, deadline=deadline
+        )
+        if self.served_videos is not None:
+            self.served_videos.add([video.video_id for video in video_metadata])
+        stages["pipeline"] = time.time() - stage_start
+        bt.logging.info(
+            f"Scraping stages ({deadline - start:.1f}s budget): "
+            + ", ".join(f"{name}={duration:.2f}s" for name, duration in stages.items())
+        )
+        return video_metadata
+
+    def harvest_topic(self, topic: str, num_videos: int) -> typing.List[VideoMetadata]:
+        """Scrapes videos for the topic pool, called from its background thread while the miner is idle."""
+        with self.augment_lock:
+            query = self.augment(topic)
+        results = video_utils.search_videos(query, max_results=self.get_num_search_candidates(num_videos))
+        results = self.select_unserved(results, num_videos)
+        return search_and_embed_videos(query, num_videos, self.embedder, self.embedding_cache, results=results)
+
+    def get_num_search_candidates(self, num_videos: int) -> int:
+        """
+        Search results to fetch for `num_videos` videos. With the topic pool on, at least a full
+        cached page, so a topic that comes up again still has unserved results once the first
+        ones have been submitted.
+        """
+        if self.served_videos is None:
+            return get_num_search_results(num_videos)
+        return max(get_num_search_results(num_videos), self.search_service.page_size)
+
+    def select_unserved(
+        self, results: typing.List[video_utils.YoutubeResult], num_videos: int
+    ) -> typing.List[video_utils.YoutubeResult]:
+        """Drops already submitted videos if they are tracked, then keeps the usual over-fetch for `num_videos`."""
+        if self.served_videos is not None:
+            results = [result for result in results if result.video_id not in self.served_videos]
+        return results[:get_num_search_results(num_videos)]
+
     async def blacklist(
         self, synapse: omega.protocol.Videos
     ) -> typing.Tuple[bool, str]:
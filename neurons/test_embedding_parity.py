@@ -0,0 +1,40 @@
+from omega.imagebind_wrapper import ImageBind, read_media
+from omega.constants import MAX_VIDEO_LENGTH
+from omega import video_utils
+import sys
+import torch.nn.functional as F
+
+# The validator API's random check fails a miner whose embeddings are below this similarity.
+SIMILARITY_THRESHOLD = 0.95
+
+imagebind = ImageBind()
+queries = ["wine and winemaking", "street food in bangkok", "live jazz concert"]
+videos_per_query = 3
+
+failed = False
+num_clips = 0
+for query in queries:
+    for result in video_utils.search_videos(query, videos_per_query):
+        video = video_utils.download_video(result.video_id, 0, min(result.length, MAX_VIDEO_LENGTH))
+        if video is None:
+            print(f"Could not download {result.video_id}, skipping")
+            continue
+        try:
+            reference = imagebind.embed_reference([result.title], [video])
+            ffmpeg_decoded = imagebind.embed_media([result.title], [read_media(video.name)])
+        finally:
+            video.close()
+        num_clips += 1
+        video_similarity = F.cosine_similarity(reference.video, ffmpeg_decoded.video).item()
+        audio_similarity = F.cosine_similarity(reference.audio, ffmpeg_decoded.audio).item()
+        print(f"{result.video_id}: video similarity {video_similarity:.4f}, audio similarity {audio_similarity:.4f}")
+        if min(video_similarity, audio_similarity) <= SIMILARITY_THRESHOLD:
+            failed = True
+
+if num_clips == 0:
+    print("No clips downloaded")
+    sys.exit(1)
+if failed:
+    print(f"FAILED: read_media embeddings are not within {SIMILARITY_THRESHOLD} of the reference loaders'")
+    sys.exit(1)
+print(f"SUCCESS! read_media embeddings match the reference loaders' on {num_clips} clips")
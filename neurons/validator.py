@@ -17,9 +17,8 @@
 # DEALINGS IN THE SOFTWARE.
 
 
-from aiohttp import ClientSession, BasicAuth
 import asyncio
-from typing import List
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 
 # Bittensor
 import bittensor as bt
@@ -27,8 +26,9 @@ import torch
 
 # Bittensor Validator Template:
 from omega.utils.uids import get_random_uids
-from omega.protocol import Videos
+from omega.protocol import Videos, EMBEDDING_ENCODING_FLOAT32
 from omega.constants import VALIDATOR_TIMEOUT
+from omega.validator.api_client import ValidatorAPIClient
 
 # import base validator class which takes care of most of the boilerplate
 from omega.base.validator import BaseValidatorNeuron
@@ -54,8 +54,7 @@ class Validator(BaseValidatorNeuron):
             if self.config.subtensor.network == "test" else
             "https://validator.api.omega-labs.ai"
         )
-        self.topics_endpoint = f"{api_root}/api/topic"
-        self.validation_endpoint = f"{api_root}/api/validate"
+        self.api_client = ValidatorAPIClient(api_root, self.dendrite.keypair)
         self.num_videos = 8
         self.client_timeout_seconds = VALIDATOR_TIMEOUT
 
@@ -84,93 +83,99 @@ class Validator(BaseValidatorNeuron):
             return
 
         try:
-            async with ClientSession() as session:
-                async with session.get(self.topics_endpoint) as response:
-                    response.raise_for_status()
-                    query = await response.json()
+            query = await self.api_client.get_topic()
         except Exception as e:
             bt.logging.error(f"Error in get_topics: {e}")
             return
 
         # The dendrite client queries the network.
         bt.logging.info(f"Sending query '{query}' to miners {miner_uids}")
-        input_synapse = Videos(query=query, num_videos=self.num_videos)
-        responses = await self.dendrite(
-            # Send the query to selected miner axons in the network.
-            axons=[self.metagraph.axons[uid] for uid in miner_uids],
-            synapse=input_synapse,
-            deserialize=False,
-            timeout=self.client_timeout_seconds,
+        input_synapse = Videos(
+            query=query,
+            num_videos=self.num_videos,
+            embedding_encodings=[EMBEDDING_ENCODING_FLOAT32],  # miners that don't support it send lists
         )
-
-        axons = [self.metagraph.axons[uid] for uid in miner_uids]
-        working_miner_uids = []
-        finished_responses = []
-
-        for response in responses:
-            if not response.video_metadata or not response.axon or not response.axon.hotkey:
-                continue
-
-            uid = [uid for uid, axon in zip(miner_uids, axons) if axon.hotkey == response.axon.hotkey][0]
-            working_miner_uids.append(uid)
-            finished_responses.append(response)
-
-        if len(working_miner_uids) == 0:
+        # Score responses as they arrive: each batch sent to the validator API holds every
+        # response that came in while the previous batch was being scored.
+        arrived: asyncio.Queue = asyncio.Queue()
+        scoring = asyncio.create_task(self.score_arrived_responses(input_synapse, arrived))
+        try:
+            async for uid, response in self.stream_responses(miner_uids, input_synapse):
+                if not response.video_metadata or not response.axon or not response.axon.hotkey:
+                    continue
+                arrived.put_nowait((uid, response))
+        finally:
+            arrived.put_nowait(None)
+        rewards = await scoring
+
+        if len(rewards) == 0:
             bt.logging.info("No miner responses available")
             return
 
-        # Log the results for monitoring purposes.
-        bt.logging.info(f"Received responses: {responses}")
+        bt.logging.info(f"Scored {sum(reward is not None for reward in rewards.values())}/{len(rewards)} responses: {rewards}")
 
-        # Adjust the scores based on responses from miners.
-        try:
-            rewards = (await self.get_rewards(input_synapse=input_synapse, responses=finished_responses)).to(self.device)
-        except Exception as e:
-            bt.logging.error(f"Error in get_rewards: {e}")
-            return
+    async def stream_responses(self, miner_uids: List[int], synapse: Videos) -> AsyncIterator[Tuple[int, Videos]]:
+        """Queries the miners concurrently and yields (uid, response) pairs in the order they complete."""
+        metagraph = self.metagraph  # resync_metagraph may swap in a new one meanwhile
+
+        async def query(uid: int) -> Tuple[int, Videos]:
+            response = await self.dendrite.call(
+                target_axon=metagraph.axons[uid],
+                synapse=synapse.copy(),
+                timeout=self.client_timeout_seconds,
+                deserialize=False,
+            )
+            return uid, response
 
-        bt.logging.info(f"Scored responses: {rewards}")
-        # Update the scores based on the rewards. You may want to define your own update_scores function for custom behavior.
-        self.update_scores(rewards, working_miner_uids)
+        for next_response in asyncio.as_completed([query(uid) for uid in miner_uids]):
+            yield await next_response
 
-    async def reward(self, input_synapse: Videos, response: Videos) -> float:
+    async def score_arrived_responses(
+        self, input_synapse: Videos, arrived: asyncio.Queue,
+    ) -> Dict[int, Optional[float]]:
         """
-        Reward the miner response to the query. This method returns a reward
-        value for the miner, which is used to update the miner's score.
-
-        Returns:
-        - float: The reward value for the miner.
+        Takes (uid, response) pairs off `arrived` until it yields None, scoring whatever has
+        queued up in one validator API request at a time and folding the rewards into the moving
+        average scores right away. Returns the reward of every uid, None where scoring failed.
         """
-        keypair = self.dendrite.keypair
-        hotkey = keypair.ss58_address
-        signature = f"0x{keypair.sign(hotkey).hex()}"
-        async with ClientSession() as session:
-            async with session.post(
-                self.validation_endpoint,
-                auth=BasicAuth(hotkey, signature),
-                json=response.to_serializable_dict(input_synapse),
-            ) as response:
-                response.raise_for_status()
-                score = await response.json()
-        return score
+        rewards = {}
+        done = False
+        while not done:
+            batch = [await arrived.get()]
+            while not arrived.empty():
+                batch.append(arrived.get_nowait())
+            if batch[-1] is None:
+                done = True
+                batch.pop()
+            if len(batch) == 0:
+                continue
+            uids = [uid for uid, _ in batch]
+            try:
+                batch_rewards = await self.get_rewards(input_synapse, [response for _, response in batch])
+            except Exception as e:
+                bt.logging.error(f"Error in get_rewards for uids {uids}: {e}")
+                rewards.update((uid, None) for uid in uids)
+                continue
+            rewards.update(zip(uids, batch_rewards))
+            scored = [(uid, reward) for uid, reward in zip(uids, batch_rewards) if reward is not None]
+            if scored:
+                # Updating some uids at a time gives the same moving average as updating them all at once.
+                self.update_scores(
+                    torch.FloatTensor([reward for _, reward in scored]).to(self.device),
+                    [uid for uid, _ in scored],
+                )
+        return rewards
 
     async def get_rewards(
         self,
         input_synapse: Videos,
         responses: List[Videos],
-    ) -> torch.FloatTensor:
+    ) -> List[Optional[float]]:
         """
-        Returns a tensor of rewards for the given query and responses.
+        Returns the rewards for the given query and responses, scored together in a single
+        validator API request. A reward is None if the API failed to score that response.
         """
-        # Get all the reward results by iteratively calling your reward() function.
-        rewards = await asyncio.gather(*[
-            self.reward(
-                input_synapse,
-                response,
-            )
-            for response in responses
-        ])
-        return torch.FloatTensor(rewards).to(self.device)
+        return await self.api_client.validate_batch(input_synapse, responses)
 
 
 # The main function parses the configuration and runs the validator.
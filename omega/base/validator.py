@@ -23,6 +23,7 @@ import asyncio
 import argparse
 import os
 import threading
+import time
 import bittensor as bt
 
 from typing import List
@@ -78,6 +79,8 @@ class BaseValidatorNeuron(BaseNeuron):
         self.is_running: bool = False
         self.thread: threading.Thread = None
         self.lock = asyncio.Lock()
+        # Guards scores and hotkeys, which forwards update on the event loop while sync runs in a thread.
+        self.scores_lock = threading.Lock()
 
     def serve_axon(self):
         """Serve axon to enable external connections."""
@@ -104,12 +107,61 @@ class BaseValidatorNeuron(BaseNeuron):
             )
             pass
 
-    async def concurrent_forward(self):
-        coroutines = [
-            self.forward()
-            for _ in range(self.config.neuron.num_concurrent_forwards)
-        ]
-        await asyncio.gather(*coroutines)
+    async def run_forwards(self):
+        """
+        Keeps `num_concurrent_forwards` forwards in flight, starting a new one as soon as any of
+        them finishes rather than waiting for the slowest, while sync_periodically resyncs the
+        metagraph and sets weights alongside.
+        """
+        sync_task = asyncio.create_task(self.sync_periodically())
+        in_flight = set()
+        try:
+            while not self.should_exit:
+                while len(in_flight) < self.config.neuron.num_concurrent_forwards:
+                    in_flight.add(asyncio.create_task(self.paced_forward()))
+                done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    err = task.exception()
+                    if err is not None:
+                        bt.logging.error(f"Error during forward: {err}")
+                        bt.logging.debug(print_exception(type(err), err, err.__traceback__))
+                    self.step += 1
+                    bt.logging.info(f"step({self.step}) done, {len(in_flight)} forwards in flight")
+                if sync_task.done():
+                    sync_task.result()  # re-raise whatever stopped the sync loop
+        finally:
+            sync_task.cancel()
+            for task in in_flight:
+                task.cancel()
+            await asyncio.gather(sync_task, *in_flight, return_exceptions=True)
+
+    async def paced_forward(self):
+        """
+        Runs forward, taking at least `neuron.min_forward_interval` seconds, so a forward that
+        returns or fails straight away (no miners available, validator API errors) is not
+        replaced in a busy loop.
+        """
+        start = time.time()
+        error = None
+        try:
+            await self.forward()
+        except Exception as e:
+            error = e
+        remaining = self.config.neuron.min_forward_interval - (time.time() - start)
+        if remaining > 0:
+            await asyncio.sleep(remaining)
+        if error is not None:
+            raise error
+
+    async def sync_periodically(self):
+        """Runs sync() every `neuron.sync_interval` seconds in a thread, off the event loop."""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.config.neuron.sync_interval)
+            try:
+                await loop.run_in_executor(None, self.sync)
+            except Exception as e:
+                bt.logging.error(f"Error during sync: {e}")
 
     def run(self):
         """
@@ -117,8 +169,8 @@ class BaseValidatorNeuron(BaseNeuron):
 
         This function performs the following primary tasks:
         1. Check for registration on the Bittensor network.
-        2. Continuously forwards queries to the miners on the network, rewarding their responses and updating the scores accordingly.
-        3. Periodically resynchronizes with the chain; updating the metagraph with the latest network state and setting weights.
+        2. Continuously forwards queries to the miners on the network, keeping `neuron.num_concurrent_forwards` in flight, rewarding their responses and updating the scores accordingly.
+        3. Periodically resynchronizes with the chain (every `neuron.sync_interval` seconds); updating the metagraph with the latest network state and setting weights.
 
         The essence of the validator's operations is in the forward function, which is called every step. The forward function is responsible for querying the network and scoring the responses.
 
@@ -136,22 +188,10 @@ class BaseValidatorNeuron(BaseNeuron):
 
         bt.logging.info(f"Validator starting at block: {self.block}")
 
-        # This loop maintains the validator's operations until intentionally stopped.
+        # Forwards run continuously, and the metagraph sync and weight setting periodically,
+        # until the validator is intentionally stopped.
         try:
-            while True:
-                bt.logging.info(f"step({self.step}) block({self.block})")
-
-                # Run multiple forwards concurrently.
-                self.loop.run_until_complete(self.concurrent_forward())
-
-                # Check if we should exit.
-                if self.should_exit:
-                    break
-
-                # Sync metagraph and potentially set weights.
-                self.sync()
-
-                self.step += 1
+            self.loop.run_until_complete(self.run_forwards())
 
         # If someone intentionally stops the validator, it'll safely terminate operations.
         except KeyboardInterrupt:
@@ -219,15 +259,18 @@ class BaseValidatorNeuron(BaseNeuron):
         Sets the validator weights to the metagraph hotkeys based on the scores it has received from the miners. The weights determine the trust and incentive level the validator assigns to miner nodes on the network.
         """
 
-        # Check if self.scores contains any NaN values and log a warning if it does.
-        if torch.isnan(self.scores).any():
+        with self.scores_lock:
+            scores = self.scores.clone()
+
+        # Check if scores contains any NaN values and log a warning if it does.
+        if torch.isnan(scores).any():
             bt.logging.warning(
                 f"Scores contain NaN values. This may be due to a lack of responses from miners, or a bug in your reward functions."
             )
 
         # Calculate the average reward for each uid across non-zero values.
         # Replace any NaN values with 0.
-        raw_weights = torch.nn.functional.normalize(self.scores, p=1, dim=0)
+        raw_weights = torch.nn.functional.normalize(scores, p=1, dim=0)
 
         bt.logging.debug("raw_weights", raw_weights)
         bt.logging.debug("raw_weight_uids", self.metagraph.uids.to("cpu"))
@@ -281,11 +324,12 @@ class BaseValidatorNeuron(BaseNeuron):
         """Resyncs the metagraph and updates the hotkeys and moving averages based on the new metagraph."""
         bt.logging.info("resync_metagraph()")
 
-        # Copies state of metagraph before syncing.
-        previous_metagraph = copy.deepcopy(self.metagraph)
-
-        # Sync the metagraph.
-        self.metagraph.sync(subtensor=self.subtensor)
+        # Sync a copy of the metagraph and swap it in whole: this runs in a thread while forwards
+        # read the metagraph on the event loop, so they must never see it half synced.
+        previous_metagraph = self.metagraph
+        metagraph = copy.deepcopy(previous_metagraph)
+        metagraph.sync(subtensor=self.subtensor)
+        self.metagraph = metagraph
 
         # Check if the metagraph axon info has changed.
         if previous_metagraph.axons == self.metagraph.axons:
@@ -294,24 +338,25 @@ class BaseValidatorNeuron(BaseNeuron):
         bt.logging.info(
             "Metagraph updated, re-syncing hotkeys, dendrite pool and moving averages"
         )
-        # Zero out all hotkeys that have been replaced.
-        for uid, hotkey in enumerate(self.hotkeys):
-            if hotkey != self.metagraph.hotkeys[uid]:
-                self.scores[uid] = 0  # hotkey has been replaced
-
-        # Check to see if the metagraph has changed size.
-        # If so, we need to add new hotkeys and moving averages.
-        if len(self.hotkeys) < len(self.metagraph.hotkeys):
-            # Update the size of the moving average scores.
-            new_moving_average = torch.zeros((self.metagraph.n)).to(
-                self.device
-            )
-            min_len = min(len(self.hotkeys), len(self.scores))
-            new_moving_average[:min_len] = self.scores[:min_len]
-            self.scores = new_moving_average
+        with self.scores_lock:
+            # Zero out all hotkeys that have been replaced.
+            for uid, hotkey in enumerate(self.hotkeys):
+                if hotkey != self.metagraph.hotkeys[uid]:
+                    self.scores[uid] = 0  # hotkey has been replaced
+
+            # Check to see if the metagraph has changed size.
+            # If so, we need to add new hotkeys and moving averages.
+            if len(self.hotkeys) < len(self.metagraph.hotkeys):
+                # Update the size of the moving average scores.
+                new_moving_average = torch.zeros((self.metagraph.n)).to(
+                    self.device
+                )
+                min_len = min(len(self.hotkeys), len(self.scores))
+                new_moving_average[:min_len] = self.scores[:min_len]
+                self.scores = new_moving_average
 
-        # Update the hotkeys.
-        self.hotkeys = copy.deepcopy(self.metagraph.hotkeys)
+            # Update the hotkeys.
+            self.hotkeys = copy.deepcopy(self.metagraph.hotkeys)
 
     def update_scores(self, rewards: torch.FloatTensor, uids: List[int]):
         """Performs exponential moving average on the scores based on the rewards received from the miners."""
@@ -328,32 +373,36 @@ class BaseValidatorNeuron(BaseNeuron):
         else:
             uids_tensor = torch.tensor(uids).to(self.device)
 
-        # Compute forward pass rewards, assumes uids are mutually exclusive.
-        # shape: [ metagraph.n ]
-        scattered_rewards: torch.FloatTensor = self.scores.to(self.device).scatter(
-            0, uids_tensor.to(self.device), rewards.to(self.device)
-        ).to(self.device)
-        bt.logging.debug(f"Scattered rewards: {rewards}")
-
-        # Update scores with rewards produced by this step.
-        # shape: [ metagraph.n ]
-        alpha: float = self.config.neuron.moving_average_alpha
-        self.scores: torch.FloatTensor = alpha * scattered_rewards + (
-            1 - alpha
-        ) * self.scores.to(self.device)
-        bt.logging.debug(f"Updated moving avg scores: {self.scores}")
+        with self.scores_lock:
+            # Compute forward pass rewards, assumes uids are mutually exclusive.
+            # shape: [ metagraph.n ]
+            scattered_rewards: torch.FloatTensor = self.scores.to(self.device).scatter(
+                0, uids_tensor.to(self.device), rewards.to(self.device)
+            ).to(self.device)
+            bt.logging.debug(f"Scattered rewards: {rewards}")
+
+            # Update scores with rewards produced by this step.
+            # shape: [ metagraph.n ]
+            alpha: float = self.config.neuron.moving_average_alpha
+            self.scores: torch.FloatTensor = alpha * scattered_rewards + (
+                1 - alpha
+            ) * self.scores.to(self.device)
+            bt.logging.debug(f"Updated moving avg scores: {self.scores}")
 
     def save_state(self):
         """Saves the state of the validator to a file."""
         bt.logging.info("Saving validator state.")
 
+        with self.scores_lock:
+            state = {
+                "step": self.step,
+                "scores": self.scores.clone(),
+                "hotkeys": copy.deepcopy(self.hotkeys),
+            }
+
         # Save the state of the validator to file.
         torch.save(
-            {
-                "step": self.step,
-                "scores": self.scores,
-                "hotkeys": self.hotkeys,
-            },
+            state,
             self.config.neuron.full_path + "/state.pt",
         )
 
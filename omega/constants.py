@@ -2,3 +2,4 @@ MIN_VIDEO_LENGTH = 5 # five seconds
 MAX_VIDEO_LENGTH = 120  # two minutes
 FIVE_MINUTES = 300  # 5 minutes in seconds
 VALIDATOR_TIMEOUT = 90  # 1.5 minutes
+EMBEDDING_DIM = 1024  # ImageBind huge embedding size
@@ -0,0 +1,108 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from omega.constants import EMBEDDING_DIM
+
+
+class EmbeddingCache:
+    """
+    Persistent store of the ImageBind embeddings the miner has already computed, keyed by
+    (video_id, start, end, description hash, model version), so a clip that comes up again
+    for another query skips both the download and the GPU.
+
+    Embeddings live in a memory-mapped float16 array of `capacity` (3, d) slots
+    (`embeddings.bin`); `index.json` maps each key to its slot, in least- to most-recently-used
+    order. When every slot is taken the least recently used entry is evicted and its slot reused.
+    The index is rewritten atomically, and a reused slot is dropped from the saved index before
+    it is overwritten, so a crash never leaves a key pointing at another video's vectors.
+    """
+
+    def __init__(self, path: str, capacity: int, model_version: str, dim: int = EMBEDDING_DIM):
+        self.path = path
+        self.capacity = capacity
+        self.model_version = model_version
+        self.dim = dim
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(path, exist_ok=True)
+
+        self.index: "OrderedDict[str, int]" = OrderedDict()
+        if os.path.exists(self.file("index.json")):
+            with open(self.file("index.json")) as f:
+                meta = json.load(f)
+            if meta["capacity"] == capacity and meta["dim"] == dim:
+                self.index = OrderedDict(meta["entries"])
+            else:
+                print(f"Embedding cache at {path} has a different shape, starting empty")
+        if len(self.index) > 0 and not os.path.exists(self.file("embeddings.bin")):
+            # The entries would point at the zeroed vectors of a new file and be served as hits.
+            print(f"Embedding cache at {path} is missing embeddings.bin, starting empty")
+            self.index = OrderedDict()
+        mode = "r+" if len(self.index) > 0 else "w+"
+        self.embeddings = np.memmap(self.file("embeddings.bin"), dtype=np.float16, mode=mode, shape=(capacity, 3, dim))
+        if mode == "w+":
+            self.save_index()  # drop any stale entries before anything is written to the new file
+        used = set(self.index.values())
+        self.free_slots = [slot for slot in range(capacity - 1, -1, -1) if slot not in used]
+
+    def file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def key(self, video_id: str, start: int, end: int, description: str) -> str:
+        description_hash = hashlib.sha256(description.encode()).hexdigest()[:16]
+        return f"{video_id}:{start}:{end}:{description_hash}:{self.model_version}"
+
+    def save_index(self) -> None:
+        tmp_path = self.file("index.json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"capacity": self.capacity, "dim": self.dim, "entries": list(self.index.items())}, f)
+        os.replace(tmp_path, self.file("index.json"))
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """Returns the (3, d) float32 video, audio and description embeddings, or None on a miss."""
+        with self.lock:
+            slot = self.index.get(key)
+            if slot is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.index.move_to_end(key)
+            return np.asarray(self.embeddings[slot], dtype=np.float32)
+
+    def put_many(self, items: List[Tuple[str, np.ndarray]]) -> None:
+        """Stores (key, (3, d) embeddings) pairs, evicting least recently used entries as needed."""
+        items = list(dict(items).items())[-self.capacity:]  # one slot per key, the last embeddings win
+        with self.lock:
+            slots = []
+            for key, _ in items:
+                if key in self.index:
+                    slots.append(self.index.pop(key))
+                elif self.free_slots:
+                    slots.append(self.free_slots.pop())
+                else:
+                    _, slot = self.index.popitem(last=False)
+                    slots.append(slot)
+            self.save_index()
+            for slot, (_, embeddings) in zip(slots, items):
+                self.embeddings[slot] = embeddings
+            self.embeddings.flush()
+            for slot, (key, _) in zip(slots, items):
+                self.index[key] = slot
+            self.save_index()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self.index),
+            "capacity": self.capacity,
+        }
@@ -1,18 +1,50 @@
 import asyncio
+import concurrent.futures
+from concurrent.futures import Future
 import functools
-from typing import List, BinaryIO
+import queue
+import threading
+import time
+from typing import Any, List, BinaryIO, Optional, Tuple, Union
 
 from imagebind import data
 from imagebind.models import imagebind_model
 from imagebind.models.imagebind_model import ModalityType
 from imagebind.models.multimodal_preprocessors import SimpleTokenizer
+import numpy as np
 from pydantic import BaseModel
+from pytorchvideo import transforms as pv_transforms
+from pytorchvideo.data.clip_sampling import ConstantClipsPerVideoSampler
 import torch
+from torchvision import transforms
+from torchvision.transforms._transforms_video import NormalizeVideo
 
 from omega import video_utils
+from omega.constants import EMBEDDING_DIM
 
 
 BPE_PATH = "./omega/bpe/bpe_simple_vocab_16e6.txt.gz"
+EMBED_BATCH_SIZE = 8  # clips per forward pass in embed_media_batch and SharedEmbedder
+EMBED_BATCH_WAIT = 0.05  # seconds SharedEmbedder waits for more clips to fill a batch
+TOKEN_CACHE_SIZE = 4096  # distinct strings whose tokens are kept around
+MODEL_VERSION = "imagebind_huge-ffmpeg_decode"  # bump when the embedding model or preprocessing changes
+
+# Vision preprocessing, same as imagebind.data.load_and_transform_video_data
+VIDEO_CLIP_DURATION = 2
+VIDEO_CLIPS_PER_VIDEO = 5
+VIDEO_FRAMES_PER_CLIP = 2
+VIDEO_SIZE = 224
+VIDEO_MEAN = (0.48145466, 0.4578275, 0.40821073)
+VIDEO_STD = (0.26862954, 0.26130258, 0.27577711)
+
+# Audio preprocessing, same as the defaults of imagebind.data.load_and_transform_audio_data
+AUDIO_SAMPLE_RATE = 16000
+AUDIO_NUM_MEL_BINS = 128
+AUDIO_TARGET_LENGTH = 204
+AUDIO_CLIP_DURATION = 2
+AUDIO_CLIPS_PER_VIDEO = 3
+AUDIO_MEAN = -4.268
+AUDIO_STD = 9.138
 
 
 class Embeddings(BaseModel):
@@ -23,14 +55,114 @@ class Embeddings(BaseModel):
     audio: torch.Tensor
     description: torch.Tensor
 
+    @classmethod
+    def cat(cls, embeddings: List["Embeddings"]) -> "Embeddings":
+        return cls(
+            video=torch.cat([e.video for e in embeddings]),
+            audio=torch.cat([e.audio for e in embeddings]),
+            description=torch.cat([e.description for e in embeddings]),
+        )
+
+    @classmethod
+    def empty(cls) -> "Embeddings":
+        return cls(
+            video=torch.empty(0, EMBEDDING_DIM),
+            audio=torch.empty(0, EMBEDDING_DIM),
+            description=torch.empty(0, EMBEDDING_DIM),
+        )
+
+
+@functools.lru_cache(maxsize=1)
+def get_tokenizer() -> SimpleTokenizer:
+    """Process-wide tokenizer, so the gzipped BPE vocabulary is only parsed once."""
+    return SimpleTokenizer(bpe_path=BPE_PATH)
+
+
+@functools.lru_cache(maxsize=TOKEN_CACHE_SIZE)
+def tokenize(text: str) -> torch.Tensor:
+    return get_tokenizer()(text)
+
+
+def tokenize_batch(texts: List[str]) -> torch.Tensor:
+    """Tokenize a batch of strings into one (N, context_length) tensor, tokenizing only cache misses."""
+    return torch.stack([tokenize(t) for t in texts])
+
 
 def load_and_transform_text(text, device):
     if text is None:
         return None
-    tokenizer = SimpleTokenizer(bpe_path=BPE_PATH)
-    tokens = [tokenizer(t).unsqueeze(0).to(device) for t in text]
-    tokens = torch.cat(tokens, dim=0)
-    return tokens
+    return tokenize_batch(text).to(device)  # single host -> device copy for the whole batch
+
+
+def get_video_clip_timepoints(duration: float) -> List[Tuple[float, float]]:
+    clip_sampler = ConstantClipsPerVideoSampler(
+        clip_duration=VIDEO_CLIP_DURATION, clips_per_video=VIDEO_CLIPS_PER_VIDEO
+    )
+    return data.get_clip_timepoints(clip_sampler, duration)
+
+
+def read_media(video_path: str) -> video_utils.MediaData:
+    return video_utils.read_media(
+        video_path, get_video_clip_timepoints, frames_per_clip=VIDEO_FRAMES_PER_CLIP, sample_rate=AUDIO_SAMPLE_RATE
+    )
+
+
+def load_and_transform_video_frames(clip_frames: List[np.ndarray], device) -> torch.Tensor:
+    """
+    Same as data.load_and_transform_video_data, but takes the frames already sampled from each
+    clip (see video_utils.read_media) instead of decoding video files.
+    """
+    video_transform = transforms.Compose([
+        pv_transforms.ShortSideScale(VIDEO_SIZE),
+        NormalizeVideo(mean=VIDEO_MEAN, std=VIDEO_STD),
+    ])
+    video_outputs = []
+    for frames in clip_frames:
+        # (clips, T, H, W, C) uint8 -> one (C, T, H, W) float clip in [0, 1] per clip
+        clips = torch.from_numpy(frames).permute(0, 4, 1, 2, 3).float() / 255.0
+        all_video = [video_transform(clip) for clip in clips]
+        all_video = data.SpatialCrop(VIDEO_SIZE, num_crops=3)(all_video)
+        video_outputs.append(torch.stack(all_video, dim=0))
+    return torch.stack(video_outputs, dim=0).to(device)
+
+
+def load_and_transform_audio_waveforms(waveforms: List[np.ndarray], device) -> torch.Tensor:
+    """
+    Same as data.load_and_transform_audio_data, but takes mono waveforms already decoded at
+    AUDIO_SAMPLE_RATE (see video_utils.read_media) instead of reading audio files.
+    """
+    clip_sampler = ConstantClipsPerVideoSampler(
+        clip_duration=AUDIO_CLIP_DURATION, clips_per_video=AUDIO_CLIPS_PER_VIDEO
+    )
+    normalize = transforms.Normalize(mean=AUDIO_MEAN, std=AUDIO_STD)
+    audio_outputs = []
+    for waveform in waveforms:
+        waveform = torch.from_numpy(waveform).unsqueeze(0)
+        all_clips = []
+        for start, end in data.get_clip_timepoints(clip_sampler, waveform.size(1) / AUDIO_SAMPLE_RATE):
+            waveform_clip = waveform[:, int(start * AUDIO_SAMPLE_RATE):int(end * AUDIO_SAMPLE_RATE)]
+            melspec = data.waveform2melspec(waveform_clip, AUDIO_SAMPLE_RATE, AUDIO_NUM_MEL_BINS, AUDIO_TARGET_LENGTH)
+            all_clips.append(normalize(melspec))
+        audio_outputs.append(torch.stack(all_clips, dim=0))
+    return torch.stack(audio_outputs, dim=0).to(device)
+
+
+def load_reference_inputs(descriptions: List[str], video_files: List[BinaryIO], device) -> dict:
+    """
+    Model inputs built with ImageBind's own loaders (decord for the frames, torchaudio for the
+    audio), the way miners running the reference code build them. read_media + get_inputs is
+    faster but only used for checks against miners once neurons/test_embedding_parity.py passes.
+    """
+    audio_files = [video_utils.copy_audio(video_file.name) for video_file in video_files]
+    try:
+        return {
+            ModalityType.TEXT: load_and_transform_text(descriptions, device),
+            ModalityType.VISION: data.load_and_transform_video_data([f.name for f in video_files], device),
+            ModalityType.AUDIO: data.load_and_transform_audio_data([f.name for f in audio_files], device),
+        }
+    finally:
+        for audio_file in audio_files:
+            audio_file.close()
 
 
 def run_async(func, *args, **kwargs):
@@ -45,26 +177,30 @@ class ImageBind:
         self.imagebind.eval()
         self.imagebind.to(self.device)
 
-    def get_inputs(self, descriptions: List[str], video_files: List[BinaryIO]) -> dict:
-        audio_files = [video_utils.copy_audio(video_file.name) for video_file in video_files]
-        audio_filepaths = [audio_file.name for audio_file in audio_files]
-        video_filepaths = [video_file.name for video_file in video_files]
-        try:
-            video_data = data.load_and_transform_video_data(video_filepaths, self.device)
-            audio_data = data.load_and_transform_audio_data(audio_filepaths, self.device)
-            inputs = {
-                ModalityType.TEXT: load_and_transform_text(descriptions, self.device),
-                ModalityType.VISION: video_data,
-                ModalityType.AUDIO: audio_data,
-            }
-            return inputs
-        finally:
-            for audio_file in audio_files:
-                audio_file.close()
+    def get_inputs(self, descriptions: List[str], media: List[video_utils.MediaData]) -> dict:
+        video_data = load_and_transform_video_frames([m.clip_frames for m in media], self.device)
+        audio_data = load_and_transform_audio_waveforms([m.waveform for m in media], self.device)
+        inputs = {
+            ModalityType.TEXT: load_and_transform_text(descriptions, self.device),
+            ModalityType.VISION: video_data,
+            ModalityType.AUDIO: audio_data,
+        }
+        return inputs
 
-    @torch.no_grad()
     def embed(self, descriptions: List[str], video_files: List[BinaryIO]) -> Embeddings:
-        inputs = self.get_inputs(descriptions, video_files)
+        return self.embed_media(descriptions, [read_media(video_file.name) for video_file in video_files])
+
+    def embed_media(self, descriptions: List[str], media: List[video_utils.MediaData]) -> Embeddings:
+        """Embed clips already decoded with read_media, so callers can decode off the GPU thread."""
+        return self.embed_inputs(self.get_inputs(descriptions, media))
+
+    def embed_reference(self, descriptions: List[str], video_files: List[BinaryIO]) -> Embeddings:
+        """embed, but decoding with ImageBind's reference loaders (see load_reference_inputs)."""
+        return self.embed_inputs(load_reference_inputs(descriptions, video_files, self.device))
+
+    @torch.no_grad()
+    def embed_inputs(self, inputs: dict) -> Embeddings:
+        inputs = {modality: tensor.to(self.device) for modality, tensor in inputs.items()}
         embeddings = self.imagebind(inputs)
         return Embeddings(
             video=embeddings[ModalityType.VISION],
@@ -72,21 +208,163 @@ class ImageBind:
             description=embeddings[ModalityType.TEXT]
         )
 
+    def embed_media_batch(
+        self, descriptions: List[str], media: List[video_utils.MediaData], batch_size: int = EMBED_BATCH_SIZE,
+        deadline: Optional[float] = None,
+    ) -> Embeddings:
+        """
+        Embed N clips already decoded with read_media and their N descriptions, running the
+        model on micro-batches of at most `batch_size` clips. Row i of the returned Embeddings
+        belongs to media[i]. With a `deadline` (a time.time() timestamp) no micro-batch starts
+        after it, and only the rows embedded by then are returned.
+        """
+        assert len(descriptions) == len(media)
+        batches = []
+        for i in range(0, len(media), batch_size):
+            if deadline is not None and time.time() >= deadline:
+                break
+            batches.append(self.embed_media(descriptions[i:i + batch_size], media[i:i + batch_size]))
+        return Embeddings.cat(batches) if batches else Embeddings.empty()
+
     @torch.no_grad()
     def embed_text(self, texts: List[str]) -> torch.Tensor:
         return self.imagebind({
             ModalityType.TEXT: load_and_transform_text(texts, self.device),
         })[ModalityType.TEXT]
 
-    @torch.no_grad()
     async def embed_async(self, descriptions: List[str], video_files: List[BinaryIO]) -> Embeddings:
-        inputs = self.get_inputs(descriptions, video_files)  # cannot be async
-        embeddings = await run_async(self.imagebind, inputs)
-        return Embeddings(
-            video=embeddings[ModalityType.VISION],
-            audio=embeddings[ModalityType.AUDIO],
-            description=embeddings[ModalityType.TEXT]
-        )
+        # Decoding the inputs runs ffmpeg, so it goes to the executor along with the forward pass.
+        return await run_async(self.embed, descriptions, video_files)
 
     async def embed_text_async(self, texts: List[str]) -> torch.Tensor:
         return await run_async(self.embed_text, texts)
+
+
+class SharedEmbedder:
+    """
+    Runs the ImageBind forward passes of every in-flight request on one GPU thread, batching
+    clips from different requests together. After the first clip of a batch arrives the thread
+    waits up to `max_wait` seconds for more, then embeds up to `batch_size` clips at once.
+    Clips come in already decoded (see read_media), so the thread only runs forward passes.
+
+    Exposes embed_media_batch like ImageBind, so EmbeddingBatcher and ScrapePipeline can use either.
+    If a batch fails, its clips are retried one by one so one bad file only fails its own request.
+    """
+
+    def __init__(self, imagebind: ImageBind, batch_size: int = EMBED_BATCH_SIZE, max_wait: float = EMBED_BATCH_WAIT):
+        self.imagebind = imagebind
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.queue: "queue.Queue[Tuple[str, video_utils.MediaData, Future]]" = queue.Queue()
+        self.thread = threading.Thread(target=self.run, name="embedder", daemon=True)
+        self.thread.start()
+
+    def embed_media_batch(
+        self, descriptions: List[str], media: List[video_utils.MediaData], batch_size: Optional[int] = None,
+        deadline: Optional[float] = None,
+    ) -> Embeddings:
+        """
+        Blocks until every clip is embedded, or until the `deadline` (a time.time() timestamp):
+        clips queued behind other requests' may not be done by then, so only the leading rows
+        embedded by the deadline are returned and the rest are dropped from the queue.
+        `batch_size` is ignored, batching is shared.
+        """
+        assert len(descriptions) == len(media)
+        futures = []
+        for description, clip_media in zip(descriptions, media):
+            future = Future()
+            self.queue.put((description, clip_media, future))
+            futures.append(future)
+        rows = []
+        try:
+            for future in futures:
+                rows.append(future.result(timeout=None if deadline is None else max(deadline - time.time(), 0)))
+        except concurrent.futures.TimeoutError:
+            pass
+        finally:
+            for future in futures[len(rows):]:
+                future.cancel()  # skipped by the embedder thread unless already running
+        if len(rows) == 0:
+            return Embeddings.empty()
+        return Embeddings(
+            video=torch.stack([row.video for row in rows]),
+            audio=torch.stack([row.audio for row in rows]),
+            description=torch.stack([row.description for row in rows]),
+        )
+
+    def next_batch(self) -> List[Tuple[str, video_utils.MediaData, Future]]:
+        items = [self.queue.get()]
+        deadline = time.time() + self.max_wait
+        while len(items) < self.batch_size:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                items.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return items
+
+    def embed_items(self, items: List[Tuple[str, video_utils.MediaData, Future]]) -> None:
+        try:
+            embeddings = self.imagebind.embed_media(
+                [description for description, _, _ in items],
+                [clip_media for _, clip_media, _ in items],
+            )
+        except Exception as e:
+            if len(items) == 1:
+                items[0][2].set_exception(e)
+                return
+            for item in items:
+                self.embed_items([item])
+            return
+        for i, (_, _, future) in enumerate(items):
+            future.set_result(Embeddings(
+                video=embeddings.video[i],
+                audio=embeddings.audio[i],
+                description=embeddings.description[i],
+            ))
+
+    def run(self) -> None:
+        while True:
+            items = [item for item in self.next_batch() if item[2].set_running_or_notify_cancel()]
+            if items:
+                self.embed_items(items)
+
+
+class EmbeddingBatcher:
+    """
+    Collects (description, decoded clip) pairs that become ready at different times and embeds
+    them together with ImageBind.embed_media_batch. Callers flush once the batch is `full`, or earlier
+    with a partial batch, e.g. when nothing else is about to arrive or a deadline is near.
+    """
+
+    def __init__(self, imagebind: Union[ImageBind, SharedEmbedder], batch_size: int = EMBED_BATCH_SIZE):
+        self.imagebind = imagebind
+        self.batch_size = batch_size
+        self.items: List[Tuple[Any, str, video_utils.MediaData]] = []
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    @property
+    def full(self) -> bool:
+        return len(self.items) >= self.batch_size
+
+    def add(self, key: Any, description: str, media: video_utils.MediaData) -> None:
+        self.items.append((key, description, media))
+
+    def flush(self, deadline: Optional[float] = None) -> Tuple[List[Any], Embeddings]:
+        """
+        Embed everything pending. Returns the keys in the same order as the embedding rows; with
+        a `deadline`, only the keys of the items embedded by then.
+        """
+        items, self.items = self.items, []
+        embeddings = self.imagebind.embed_media_batch(
+            [description for _, description, _ in items],
+            [media for _, _, media in items],
+            batch_size=self.batch_size,
+            deadline=deadline,
+        )
+        keys = [key for key, _, _ in items[:len(embeddings.video)]]
+        return keys, embeddings
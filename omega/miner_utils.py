@@ -1,11 +1,16 @@
 import os
 import time
-from typing import List, Tuple
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from typing import BinaryIO, Dict, List, Optional, Tuple, Union
 
 import bittensor as bt
+import numpy as np
+import torch
+from pydantic import BaseModel
 
+from omega.embedding_cache import EmbeddingCache
 from omega.protocol import VideoMetadata
-from omega.imagebind_wrapper import ImageBind
+from omega.imagebind_wrapper import ImageBind, EmbeddingBatcher, SharedEmbedder, EMBED_BATCH_SIZE, read_media
 from omega.constants import MAX_VIDEO_LENGTH, FIVE_MINUTES
 from omega import video_utils
 
@@ -16,6 +21,10 @@ if os.getenv("OPENAI_API_KEY"):
 else:
     OPENAI_CLIENT = None
 
+DOWNLOAD_WORKERS = 4  # concurrent YouTube downloads per request
+CLIP_WORKERS = 2  # concurrent ffmpeg probe / clip processes per request
+SEARCH_OVERFETCH = 1.5  # search results per requested video, as some fail to download or clip
+
 
 def get_description(yt: video_utils.YoutubeDL, video_path: str) -> str:
     """
@@ -43,56 +52,291 @@ def get_relevant_timestamps(query: str, yt: video_utils.YoutubeDL, video_path: s
     return start_time, end_time
 
 
-def search_and_embed_videos(query: str, num_videos: int, imagebind: ImageBind) -> List[VideoMetadata]:
+def predict_clip(query: str, result: video_utils.YoutubeResult) -> Optional[Tuple[int, int, str]]:
+    """
+    The start, end and description the clip of `result` would get, worked out from the search
+    result alone (video_path=None) so the embedding cache can be checked before downloading.
+    Returns None when the implementations above need the downloaded video.
+    """
+    try:
+        start, end = get_relevant_timestamps(query, result, None)
+        return start, end, get_description(result, None)
+    except Exception:
+        return None
+
+
+def get_cache_key(embedding_cache: Optional[EmbeddingCache], query: str, result: video_utils.YoutubeResult) -> Optional[str]:
+    """
+    Embedding cache key of the clip predict_clip expects for the search result. Lookups and
+    stores both key on it, so both go by the search result's length, not the probed one.
+    """
+    if embedding_cache is None:
+        return None
+    clip = predict_clip(query, result)
+    if clip is None:
+        return None
+    start, end, description = clip
+    return embedding_cache.key(result.video_id, start, end, description)
+
+
+class ClipJob(BaseModel):
+    """A downloaded, clipped and decoded video that is ready to be embedded."""
+    class Config:
+        arbitrary_types_allowed = True
+
+    result: video_utils.YoutubeResult
+    description: str
+    start_time: int
+    end_time: int
+    media: video_utils.MediaData
+    cache_key: Optional[str] = None
+
+
+def download_result(result: video_utils.YoutubeResult) -> Optional[BinaryIO]:
+    start = time.time()
+    download_path = video_utils.download_video(
+        result.video_id,
+        start=0,
+        end=min(result.length, FIVE_MINUTES)  # download the first 5 minutes at most
+    )
+    if download_path:
+        bt.logging.info(f"Downloaded video {result.video_id} ({min(result.length, FIVE_MINUTES)}) in {time.time() - start} seconds")
+    return download_path
+
+
+def clip_result(
+    query: str, result: video_utils.YoutubeResult, download_path: BinaryIO,
+    embedding_cache: Optional[EmbeddingCache] = None,
+) -> ClipJob:
+    try:
+        cache_key = get_cache_key(embedding_cache, query, result)  # before the length is corrected
+        # Search results can be shared with other requests through the search cache, so correct a copy.
+        result = result.copy(update={"length": video_utils.get_video_duration(download_path.name)})
+        start, end = get_relevant_timestamps(query, result, download_path)
+        description = get_description(result, download_path)
+        # Decode here, on the clip pool, so the embedding thread only runs forward passes.
+        with video_utils.clip_video(download_path.name, start, end) as clip_path:
+            media = read_media(clip_path.name)
+        return ClipJob(
+            result=result,
+            description=description,
+            start_time=start,
+            end_time=end,
+            media=media,
+            cache_key=cache_key,
+        )
+    finally:
+        download_path.close()
+
+
+def close_future_result(future: Future) -> None:
+    """Done callback that releases the temp file produced by an abandoned stage."""
+    if future.cancelled() or future.exception() is not None:
+        return
+    output = future.result()
+    if output is not None and not isinstance(output, ClipJob):  # clip jobs hold no files
+        output.close()
+
+
+class ScrapePipeline:
+    """
+    Staged download -> clip -> embed engine for a single scraping request.
+
+    Results whose embeddings are already in `embedding_cache` are served from it without
+    downloading. The rest are downloaded on a bounded thread pool, every finished download is
+    probed, clipped and decoded on an ffmpeg pool, and ready clips are embedded in micro-batches from the
+    calling thread, either directly with ImageBind or through a SharedEmbedder that batches
+    them with the clips of other in-flight requests. Once `num_videos` embeddings are done, queued downloads
+    are cancelled and the files of any stage still in flight are cleaned up when it ends.
+    """
+
+    def __init__(
+        self, imagebind: Union[ImageBind, SharedEmbedder],
+        download_workers: int = DOWNLOAD_WORKERS, clip_workers: int = CLIP_WORKERS,
+        embed_batch_size: int = EMBED_BATCH_SIZE, embedding_cache: Optional[EmbeddingCache] = None,
+    ):
+        self.imagebind = imagebind
+        self.download_workers = download_workers
+        self.clip_workers = clip_workers
+        self.embed_batch_size = embed_batch_size
+        self.embedding_cache = embedding_cache
+
+    def lookup_cached(
+        self, query: str, results: List[video_utils.YoutubeResult], num_videos: int
+    ) -> Tuple[List[VideoMetadata], List[video_utils.YoutubeResult]]:
+        """Splits the results into videos served from the embedding cache and ones still to scrape."""
+        if self.embedding_cache is None:
+            return [], results
+        cached, remaining = [], []
+        for result in results:
+            clip = predict_clip(query, result) if len(cached) < num_videos else None
+            embeddings = None
+            if clip is not None:
+                start, end, description = clip
+                embeddings = self.embedding_cache.get(
+                    self.embedding_cache.key(result.video_id, start, end, description)
+                )
+            if embeddings is None:
+                remaining.append(result)
+                continue
+            cached.append(VideoMetadata(
+                video_id=result.video_id,
+                description=description,
+                views=result.views,
+                start_time=start,
+                end_time=end,
+                video_emb=embeddings[0].tolist(),
+                audio_emb=embeddings[1].tolist(),
+                description_emb=embeddings[2].tolist(),
+            ))
+        return cached, remaining
+
+    def embed_clips(self, batcher: EmbeddingBatcher, deadline: Optional[float] = None) -> List[VideoMetadata]:
+        num_jobs = len(batcher)
+        jobs, embeddings = batcher.flush(deadline)
+        if len(jobs) < num_jobs:
+            bt.logging.warning(f"Embedded {len(jobs)}/{num_jobs} clips by the scraping deadline")
+        if self.embedding_cache is not None:
+            stacked = torch.stack([embeddings.video, embeddings.audio, embeddings.description], dim=1)
+            self.embedding_cache.put_many([
+                (job.cache_key, vectors)
+                for job, vectors in zip(jobs, stacked.cpu().numpy().astype(np.float16))
+                if job.cache_key is not None
+            ])
+        return [
+            VideoMetadata(
+                video_id=job.result.video_id,
+                description=job.description,
+                views=job.result.views,
+                start_time=job.start_time,
+                end_time=job.end_time,
+                video_emb=embeddings.video[i].tolist(),
+                audio_emb=embeddings.audio[i].tolist(),
+                description_emb=embeddings.description[i].tolist(),
+            )
+            for i, job in enumerate(jobs)
+        ]
+
+    def run(
+        self, query: str, results: List[video_utils.YoutubeResult], num_videos: int,
+        deadline: Optional[float] = None,
+    ) -> List[VideoMetadata]:
+        """
+        Scrape up to `num_videos` videos. With a `deadline` (a time.time() timestamp), stops
+        waiting on downloads and clips early enough to embed what is ready by the deadline,
+        reserving as long as the last embedding batch took, and returns the partial results.
+        Embedding itself also stops at the deadline, for when clips of other requests sharing the
+        embedder hold this one's up for longer than that.
+        """
+        start = time.time()
+        video_metas, results = self.lookup_cached(query, results, num_videos)
+        if len(video_metas) > 0:
+            bt.logging.info(f"Served {len(video_metas)} videos from the embedding cache")
+        batcher = EmbeddingBatcher(self.imagebind, batch_size=self.embed_batch_size)
+        download_pool = ThreadPoolExecutor(max_workers=self.download_workers, thread_name_prefix="download")
+        clip_pool = ThreadPoolExecutor(max_workers=self.clip_workers, thread_name_prefix="clip")
+        downloads: Dict[Future, video_utils.YoutubeResult] = {
+            download_pool.submit(download_result, result): result
+            for result in results
+        }
+        clips: Dict[Future, Tuple[video_utils.YoutubeResult, BinaryIO]] = {}  # -> (result, download)
+        num_downloaded = num_clipped = num_batches = 0
+        embed_time = last_embed_time = 0.0
+        try:
+            while (downloads or clips or len(batcher) > 0) and len(video_metas) < num_videos:
+                time_left = None if deadline is None else deadline - last_embed_time - time.time()
+                deadline_reached = time_left is not None and time_left <= 0
+                # Embed as soon as the batch is full, the batch alone completes the request, the
+                # clip stage has drained and the GPU would otherwise wait on a download, or time is up.
+                if len(batcher) > 0 and (
+                    batcher.full or
+                    len(video_metas) + len(batcher) >= num_videos or
+                    not clips or
+                    deadline_reached
+                ):
+                    embed_start = time.time()
+                    video_metas.extend(self.embed_clips(batcher, deadline))
+                    last_embed_time = time.time() - embed_start
+                    embed_time += last_embed_time
+                    num_batches += 1
+                    continue
+                if deadline_reached:
+                    bt.logging.warning(
+                        f"Scraping deadline reached with {len(video_metas)}/{num_videos} videos, "
+                        f"returning partial results"
+                    )
+                    break
+
+                done, _ = wait(list(downloads) + list(clips), timeout=time_left, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if len(video_metas) + len(batcher) >= num_videos:
+                        break  # leftover outputs are released by the finally block
+                    if future in downloads:
+                        result = downloads.pop(future)
+                        try:
+                            download_path = future.result()
+                        except Exception as e:
+                            bt.logging.warning(f"Error downloading video {result.video_id}: {e}")
+                            continue
+                        if download_path:
+                            num_downloaded += 1
+                            clips[clip_pool.submit(clip_result, query, result, download_path, self.embedding_cache)] = (result, download_path)
+                        continue
+
+                    result, _ = clips.pop(future)
+                    try:
+                        job = future.result()
+                    except Exception as e:
+                        bt.logging.warning(f"Error clipping video {result.video_id}: {e}")
+                        continue
+                    num_clipped += 1
+                    batcher.add(job, job.description, job.media)
+        except Exception as e:
+            bt.logging.error(f"Error searching for videos: {e}")
+        finally:
+            for future in downloads:
+                future.cancel()
+                future.add_done_callback(close_future_result)
+            for future, (_, download_path) in clips.items():
+                if future.cancel():
+                    download_path.close()  # clip_result never ran to close it
+                else:
+                    future.add_done_callback(close_future_result)
+            download_pool.shutdown(wait=False)
+            clip_pool.shutdown(wait=False)
+        bt.logging.info(
+            f"Scrape pipeline: {len(video_metas)}/{num_videos} videos in {time.time() - start:.2f}s "
+            f"({num_downloaded} downloaded, {num_clipped} clipped, {num_batches} embedding batches "
+            f"in {embed_time:.2f}s, {len(downloads) + len(clips)} abandoned)"
+            + ("" if deadline is None else f", {deadline - time.time():.2f}s left before the deadline")
+        )
+        return video_metas
+
+
+def get_num_search_results(num_videos: int) -> int:
+    return int(num_videos * SEARCH_OVERFETCH)
+
+
+def search_and_embed_videos(
+    query: str, num_videos: int, imagebind: Union[ImageBind, SharedEmbedder],
+    embedding_cache: Optional[EmbeddingCache] = None,
+    results: Optional[List[video_utils.YoutubeResult]] = None, deadline: Optional[float] = None,
+) -> List[VideoMetadata]:
     """
     Search YouTube for videos matching the given query and return a list of VideoMetadata objects.
 
     Args:
         query (str): The query to search for.
         num_videos (int, optional): The number of videos to return.
+        embedding_cache (EmbeddingCache, optional): Store of previously computed embeddings to reuse.
+        results (List[YoutubeResult], optional): Search results to use instead of searching here,
+            e.g. from SearchService.
+        deadline (float, optional): time.time() by which to return, with partial results if needed.
 
     Returns:
         List[VideoMetadata]: A list of VideoMetadata objects representing the search results.
     """
-    # fetch more videos than we need
-    results = video_utils.search_videos(query, max_results=int(num_videos * 1.5))
-    video_metas = []
-    try:
-        # take the first N that we need
-        for result in results:
-            start = time.time()
-            download_path = video_utils.download_video(
-                result.video_id,
-                start=0,
-                end=min(result.length, FIVE_MINUTES)  # download the first 5 minutes at most
-            )
-            if download_path:
-                clip_path = None
-                try:
-                    result.length = video_utils.get_video_duration(download_path.name)  # correct the length
-                    bt.logging.info(f"Downloaded video {result.video_id} ({min(result.length, FIVE_MINUTES)}) in {time.time() - start} seconds")
-                    start, end = get_relevant_timestamps(query, result, download_path)
-                    description = get_description(result, download_path)
-                    clip_path = video_utils.clip_video(download_path.name, start, end)
-                    embeddings = imagebind.embed([description], [clip_path])
-                    video_metas.append(VideoMetadata(
-                        video_id=result.video_id,
-                        description=description,
-                        views=result.views,
-                        start_time=start,
-                        end_time=end,
-                        video_emb=embeddings.video[0].tolist(),
-                        audio_emb=embeddings.audio[0].tolist(),
-                        description_emb=embeddings.description[0].tolist(),
-                    ))
-                finally:
-                    download_path.close()
-                    if clip_path:
-                        clip_path.close()
-            if len(video_metas) == num_videos:
-                break
-
-    except Exception as e:
-        bt.logging.error(f"Error searching for videos: {e}")
-
-    return video_metas
+    if results is None:
+        # fetch more videos than we need
+        results = video_utils.search_videos(query, max_results=get_num_search_results(num_videos))
+    return ScrapePipeline(imagebind, embedding_cache=embedding_cache).run(query, results, num_videos, deadline)
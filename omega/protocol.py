@@ -16,35 +16,121 @@
 # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 # DEALINGS IN THE SOFTWARE.
 
+import base64
 import typing
 import json
 
 import bittensor as bt
-from pydantic import BaseModel
+import numpy as np
+from pydantic import BaseModel, root_validator
+
+from omega.constants import EMBEDDING_DIM
+
+
+EMBEDDING_ENCODING_LIST = "list"
+EMBEDDING_ENCODING_FLOAT32 = "base64-float32"
+EMBEDDING_ENCODING_FLOAT16 = "base64-float16"
+PACKED_DTYPES = {
+    EMBEDDING_ENCODING_FLOAT32: np.dtype("<f4"),
+    EMBEDDING_ENCODING_FLOAT16: np.dtype("<f2"),
+}
+SUPPORTED_EMBEDDING_ENCODINGS = [EMBEDDING_ENCODING_LIST] + list(PACKED_DTYPES)
 
 
 class VideoMetadata(BaseModel):
     """
     A model class representing YouTube video metadata.
+
+    The video, audio and description embeddings travel either as three lists of floats, or
+    packed as one base64 buffer of a little-endian (3, d) array in the order video, audio,
+    description, with `packed_encoding` naming the element type.
     """
     video_id: str
     description: str
     views: int
     start_time: int
     end_time: int
-    video_emb: typing.List[float]
-    audio_emb: typing.List[float]
-    description_emb: typing.List[float]
+    video_emb: typing.Optional[typing.List[float]] = None
+    audio_emb: typing.Optional[typing.List[float]] = None
+    description_emb: typing.Optional[typing.List[float]] = None
+    packed_embs: typing.Optional[str] = None
+    packed_encoding: typing.Optional[str] = None
+
+    @root_validator(skip_on_failure=True)
+    def check_embeddings(cls, values):
+        if values.get("packed_embs") is not None:
+            encoding = values.get("packed_encoding")
+            if encoding not in PACKED_DTYPES:
+                raise ValueError(f"Unsupported packed_encoding: {encoding}")
+            num_bytes = len(base64.b64decode(values["packed_embs"], validate=True))
+            if num_bytes == 0 or num_bytes % (3 * PACKED_DTYPES[encoding].itemsize) != 0:
+                raise ValueError("packed_embs must hold a (3, d) array")
+        elif any(values.get(field) is None for field in ("video_emb", "audio_emb", "description_emb")):
+            raise ValueError("Either packed_embs or video_emb, audio_emb and description_emb are required")
+        return values
+
+    def get_embeddings(self) -> np.ndarray:
+        """Returns the (3, d) float32 array of the video, audio and description embeddings."""
+        if self.packed_embs is not None:
+            dtype = PACKED_DTYPES[self.packed_encoding]
+            packed = np.frombuffer(base64.b64decode(self.packed_embs), dtype=dtype)
+            return packed.reshape(3, -1).astype(np.float32)
+        return np.array([self.video_emb, self.audio_emb, self.description_emb], dtype=np.float32)
+
+    def write_embeddings(self, out: np.ndarray) -> None:
+        """Decodes the embeddings in place into `out`, a (3, d) float32 array or view."""
+        if self.packed_embs is not None:
+            dtype = PACKED_DTYPES[self.packed_encoding]
+            out[:] = np.frombuffer(base64.b64decode(self.packed_embs), dtype=dtype).reshape(out.shape)
+        else:
+            out[0] = self.video_emb
+            out[1] = self.audio_emb
+            out[2] = self.description_emb
+
+    def encode(self, encoding: str) -> "VideoMetadata":
+        """Returns a copy carrying its embeddings in the given wire encoding."""
+        if encoding == EMBEDDING_ENCODING_LIST:
+            embeddings = self.get_embeddings()
+            return self.copy(update={
+                "video_emb": embeddings[0].tolist(),
+                "audio_emb": embeddings[1].tolist(),
+                "description_emb": embeddings[2].tolist(),
+                "packed_embs": None,
+                "packed_encoding": None,
+            })
+        packed = self.get_embeddings().astype(PACKED_DTYPES[encoding])
+        return self.copy(update={
+            "video_emb": None,
+            "audio_emb": None,
+            "description_emb": None,
+            "packed_embs": base64.b64encode(packed.tobytes()).decode("ascii"),
+            "packed_encoding": encoding,
+        })
 
     def __repr_args__(self):
         parent_args = super().__repr_args__()
-        exclude_args = ['video_emb', 'audio_emb', 'description_emb']
+        exclude_args = ['video_emb', 'audio_emb', 'description_emb', 'packed_embs']
         return (
             [(a, v) for a, v in parent_args if a not in exclude_args] +
             [(a, ["..."]) for a in exclude_args]
         )
 
 
+def get_embedding_matrix(metadata: typing.List[VideoMetadata]) -> np.ndarray:
+    """
+    Decodes the embeddings of all videos, from whichever wire form each one uses, directly into
+    a single contiguous (n, 3, d) float32 array. Raises ValueError if the videos disagree on d.
+    """
+    if len(metadata) == 0:
+        return np.empty((0, 3, EMBEDDING_DIM), dtype=np.float32)
+    first = metadata[0].get_embeddings()
+    matrix = np.empty((len(metadata),) + first.shape, dtype=np.float32)
+    matrix[0] = first
+    for row, video in zip(matrix[1:], metadata[1:]):
+        video.write_embeddings(row)
+    return matrix
+
+
 class Videos(bt.Synapse):
     """
     A synapse class representing a video scraping request and response.
@@ -52,13 +138,27 @@ class Videos(bt.Synapse):
     Attributes:
     - query: the input query for which to find relevant videos
     - num_videos: the number of videos to return
+    - embedding_encodings: the embedding encodings the requester accepts, most preferred first;
+      requesters that predate compact encodings leave it unset and get lists of floats
     - video_metadata: a list of video metadata objects
     """
 
     query: str
     num_videos: int
+    embedding_encodings: typing.Optional[typing.List[str]] = None
     video_metadata: typing.Optional[typing.List[VideoMetadata]] = None
 
+    def select_embedding_encoding(self) -> str:
+        """The first requested embedding encoding that we support, falling back to lists."""
+        for encoding in self.embedding_encodings or []:
+            if encoding in SUPPORTED_EMBEDDING_ENCODINGS:
+                return encoding
+        return EMBEDDING_ENCODING_LIST
+
+    def get_embedding_matrix(self) -> np.ndarray:
+        """The (n, 3, d) float32 embedding matrix of video_metadata, see get_embedding_matrix."""
+        return get_embedding_matrix(self.video_metadata or [])
+
     def deserialize(self) -> typing.List[VideoMetadata]:
         assert self.video_metadata is not None
         return self.video_metadata
@@ -75,3 +175,35 @@ class Videos(bt.Synapse):
             video_metadata=self.video_metadata,
         ).json(include={"query", "num_videos", "video_metadata"})
         return json.loads(json_str)
+
+
+class VideosBatch(BaseModel):
+    """
+    All the miner responses to one validator query, submitted to the validator API together.
+
+    Attributes:
+    - query: the query the miners were sent
+    - num_videos: the number of videos each miner was asked for
+    - responses: the video metadata of each response, in the order scores are returned
+    """
+
+    query: str
+    num_videos: int
+    responses: typing.List[typing.List[VideoMetadata]]
+
+    @classmethod
+    def from_responses(cls, input_synapse: Videos, responses: typing.List[Videos]) -> "VideosBatch":
+        return cls(
+            query=input_synapse.query,
+            num_videos=input_synapse.num_videos,
+            responses=[response.video_metadata or [] for response in responses],
+        )
+
+    def to_videos(self) -> typing.List[Videos]:
+        return [
+            Videos(query=self.query, num_videos=self.num_videos, video_metadata=video_metadata)
+            for video_metadata in self.responses
+        ]
+
+    def to_serializable_dict(self) -> dict:
+        return json.loads(self.json())
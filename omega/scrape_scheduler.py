@@ -0,0 +1,82 @@
+import functools
+import heapq
+import itertools
+import threading
+from concurrent.futures import Future
+from typing import Callable, List, Tuple
+
+
+class AdmissionRejected(Exception):
+    """The scheduler turned a job away because its queue was full of higher priority jobs."""
+
+
+class ScrapeScheduler:
+    """
+    Runs blocking scrape jobs on `workers` threads, so the miner's async forward can await them
+    without stalling the axon's event loop.
+
+    Queued jobs run highest priority (caller stake) first. At most `max_queue` jobs wait at a
+    time: when the queue is full and no worker is idle, a new job displaces the lowest priority
+    queued job if it outranks it, and is rejected otherwise. With `max_queue` 0 nothing waits,
+    so jobs are only admitted while a worker is idle. Rejected and displaced jobs fail with
+    AdmissionRejected, so the caller can answer straight away instead of timing out.
+    """
+
+    def __init__(self, workers: int, max_queue: int):
+        if workers < 1 or max_queue < 0:
+            raise ValueError(f"Need at least one worker and a non-negative queue size, got {workers} and {max_queue}")
+        self.workers = workers
+        self.max_queue = max_queue
+        self.condition = threading.Condition()
+        self.queue: List[Tuple[float, int, Future, Callable]] = []  # heap of (-priority, seq, future, job)
+        self.sequence = itertools.count()
+        self.running = 0
+        self.threads = [
+            threading.Thread(target=self.run, name=f"scrape-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def __len__(self) -> int:
+        return len(self.queue)
+
+    @property
+    def busy(self) -> bool:
+        return self.running > 0 or len(self.queue) > 0
+
+    def submit(self, priority: float, fn: Callable, *args, **kwargs) -> Future:
+        future = Future()
+        with self.condition:
+            if len(self.queue) >= self.max_queue and self.running + len(self.queue) >= self.workers:
+                if not self.queue:
+                    future.set_exception(AdmissionRejected(f"All {self.workers} workers are busy"))
+                    return future
+                lowest = max(self.queue)
+                if -lowest[0] >= priority:
+                    future.set_exception(AdmissionRejected(f"Queue is full ({len(self.queue)} jobs)"))
+                    return future
+                self.queue.remove(lowest)
+                heapq.heapify(self.queue)
+                lowest[2].set_exception(AdmissionRejected("Displaced by a higher priority job"))
+            heapq.heappush(self.queue, (-priority, next(self.sequence), future, functools.partial(fn, *args, **kwargs)))
+            self.condition.notify()
+        return future
+
+    def run(self) -> None:
+        while True:
+            with self.condition:
+                while not self.queue:
+                    self.condition.wait()
+                _, _, future, job = heapq.heappop(self.queue)
+                self.running += 1
+            try:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    future.set_result(job())
+                except BaseException as e:
+                    future.set_exception(e)
+            finally:
+                with self.condition:
+                    self.running -= 1
@@ -0,0 +1,158 @@
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Tuple
+
+import bittensor as bt
+import requests
+
+from omega.protocol import VideoMetadata, EMBEDDING_ENCODING_FLOAT16
+
+
+SERVED_VIDEOS_SIZE = 100_000  # video ids remembered as already submitted
+TOPICS_REFRESH_INTERVAL = 30 * 60  # seconds
+HARVEST_IDLE_SLEEP = 5  # seconds to wait when the pool is full or the miner is busy
+
+
+class ServedVideoTracker:
+    """Bounded, thread-safe record of the video ids the miner has already submitted."""
+
+    def __init__(self, max_size: int = SERVED_VIDEOS_SIZE):
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.video_ids: "OrderedDict[str, None]" = OrderedDict()
+
+    def __contains__(self, video_id: str) -> bool:
+        with self.lock:
+            return video_id in self.video_ids
+
+    def add(self, video_ids: List[str]) -> None:
+        with self.lock:
+            for video_id in video_ids:
+                self.video_ids[video_id] = None
+                self.video_ids.move_to_end(video_id)
+            while len(self.video_ids) > self.max_size:
+                self.video_ids.popitem(last=False)
+
+
+class TopicPool:
+    """
+    Videos scraped ahead of time for the topics validators query, so a request for a known
+    topic can be answered straight from memory.
+
+    A background thread fetches the topic list from the validator API and, whenever `is_busy()`
+    is false, scrapes the topic with the fewest fresh videos until every topic holds
+    `videos_per_topic`. Videos older than `max_age` seconds are dropped, videos already in
+    `served` are never handed out, and at most `max_topics` topics are kept, so memory stays
+    bounded. Embeddings are held in the compact float16 wire encoding.
+    """
+
+    def __init__(
+        self, topics_url: str, scrape_fn: Callable[[str, int], List[VideoMetadata]],
+        is_busy: Callable[[], bool], served: ServedVideoTracker,
+        videos_per_topic: int, max_age: float, max_topics: int,
+    ):
+        self.topics_url = topics_url
+        self.scrape_fn = scrape_fn
+        self.is_busy = is_busy
+        self.served = served
+        self.videos_per_topic = videos_per_topic
+        self.max_age = max_age
+        self.max_topics = max_topics
+        self.lock = threading.Lock()
+        self.topics: List[str] = []
+        self.topics_fetched_at = 0.0
+        self.pool: Dict[str, List[Tuple[float, VideoMetadata]]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.thread = threading.Thread(target=self.run, name="topic-pool", daemon=True)
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def fresh_videos(self, topic: str) -> List[Tuple[float, VideoMetadata]]:
+        """Drops expired and already served videos of the topic; call with the lock held."""
+        now = time.time()
+        videos = [
+            (harvested_at, video) for harvested_at, video in self.pool.get(topic, [])
+            if now - harvested_at <= self.max_age and video.video_id not in self.served
+        ]
+        self.pool[topic] = videos
+        return videos
+
+    def take(self, topic: str, num_videos: int) -> List[VideoMetadata]:
+        """Removes and returns up to `num_videos` fresh videos for the topic, marking them served."""
+        with self.lock:
+            if topic not in self.pool:
+                self.misses += 1
+                return []
+            videos = self.fresh_videos(topic)
+            taken, self.pool[topic] = videos[:num_videos], videos[num_videos:]
+        taken = [video for _, video in taken]
+        self.served.add([video.video_id for video in taken])
+        if taken:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return taken
+
+    def refresh_topics(self) -> None:
+        response = requests.get(self.topics_url, timeout=30)
+        response.raise_for_status()
+        topics = response.json()[:self.max_topics]
+        with self.lock:
+            self.topics = topics
+            self.pool = {topic: self.pool.get(topic, []) for topic in topics}
+        self.topics_fetched_at = time.time()
+        bt.logging.info(f"Topic pool tracking {len(topics)} topics")
+
+    def next_topic(self) -> Tuple[str, int]:
+        """The topic most in need of videos, and how many it needs (0 if the pool is full)."""
+        with self.lock:
+            shortfall = {topic: self.videos_per_topic - len(self.fresh_videos(topic)) for topic in self.topics}
+        if not shortfall:
+            return "", 0
+        most_needed = max(shortfall.values())
+        topic = random.choice([topic for topic, needed in shortfall.items() if needed == most_needed])
+        return topic, most_needed
+
+    def harvest(self, topic: str, num_videos: int) -> None:
+        videos = [
+            video.encode(EMBEDDING_ENCODING_FLOAT16)
+            for video in self.scrape_fn(topic, num_videos)
+            if video.video_id not in self.served
+        ]
+        now = time.time()
+        with self.lock:
+            if topic in self.pool:
+                pooled = {video.video_id for _, video in self.pool[topic]}
+                self.pool[topic].extend((now, video) for video in videos if video.video_id not in pooled)
+                del self.pool[topic][self.videos_per_topic:]
+        bt.logging.info(f"Topic pool harvested {len(videos)} videos for '{topic}'")
+
+    def run(self) -> None:
+        while True:
+            try:
+                if time.time() - self.topics_fetched_at > TOPICS_REFRESH_INTERVAL:
+                    self.refresh_topics()
+                topic, needed = self.next_topic()
+                if needed <= 0 or self.is_busy():
+                    time.sleep(HARVEST_IDLE_SLEEP)
+                    continue
+                self.harvest(topic, needed)
+            except Exception as e:
+                bt.logging.error(f"Error in topic pool harvester: {e}")
+                time.sleep(HARVEST_IDLE_SLEEP)
+
+    def stats(self) -> dict:
+        with self.lock:
+            pooled = sum(len(videos) for videos in self.pool.values())
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "topics": len(self.topics),
+            "videos": pooled,
+        }
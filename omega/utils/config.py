@@ -145,6 +145,69 @@ def add_miner_args(cls, parser):
         default=QueryAugment.LocalLLMAugment.value,
     )
 
+    parser.add_argument(
+        "--neuron.deadline_margin",
+        type=float,
+        help="Seconds before the validator's timeout by which scraping stops and returns what it has.",
+        default=10,
+    )
+
+    parser.add_argument(
+        "--neuron.scrape_workers",
+        type=int,
+        help="How many scraping requests are processed at the same time.",
+        default=2,
+    )
+
+    parser.add_argument(
+        "--neuron.scrape_queue_size",
+        type=int,
+        help="How many scraping requests may wait for a worker; beyond that the lowest stake requests are dropped.",
+        default=8,
+    )
+
+    parser.add_argument(
+        "--neuron.embed_batch_wait",
+        type=float,
+        help="Seconds the embedder waits for clips from other requests to fill a batch.",
+        default=0.05,
+    )
+
+    parser.add_argument(
+        "--neuron.topic_pool_videos",
+        type=int,
+        help="Videos to scrape ahead of time for each validator topic while idle (0 disables the topic pool).",
+        default=0,
+    )
+
+    parser.add_argument(
+        "--neuron.topic_pool_max_age",
+        type=float,
+        help="Seconds a pre-scraped video stays in the topic pool.",
+        default=3600,
+    )
+
+    parser.add_argument(
+        "--neuron.topic_pool_topics",
+        type=int,
+        help="Maximum number of topics kept in the topic pool.",
+        default=100,
+    )
+
+    parser.add_argument(
+        "--neuron.embedding_cache_size",
+        type=int,
+        help="How many clip embeddings to keep on disk for reuse across requests (0 disables the cache).",
+        default=20000,
+    )
+
+    parser.add_argument(
+        "--neuron.embedding_cache_path",
+        type=str,
+        help="Directory of the embedding cache, defaults to <neuron.full_path>/embedding_cache.",
+        default=None,
+    )
+
     parser.add_argument(
         "--blacklist.force_validator_permit",
         action="store_true",
@@ -194,10 +257,24 @@ def add_validator_args(cls, parser):
     parser.add_argument(
         "--neuron.num_concurrent_forwards",
         type=int,
-        help="The number of concurrent forwards running at any time.",
+        help="The number of forwards kept in flight at any time; a new one starts as soon as one finishes.",
         default=1,
     )
 
+    parser.add_argument(
+        "--neuron.min_forward_interval",
+        type=float,
+        help="Minimum seconds each forward takes; one that returns early waits out the rest before it is replaced.",
+        default=5,
+    )
+
+    parser.add_argument(
+        "--neuron.sync_interval",
+        type=float,
+        help="Seconds between metagraph syncs / weight setting checks, which run alongside the forwards.",
+        default=60,
+    )
+
     parser.add_argument(
         "--neuron.sample_size",
         type=int,
@@ -0,0 +1,89 @@
+import asyncio
+import random
+from typing import List, Optional
+
+import aiohttp
+import bittensor as bt
+
+from omega.protocol import Videos, VideosBatch
+
+
+API_CONNECTION_LIMIT = 32  # pooled connections to the validator API
+API_KEEPALIVE_TIMEOUT = 60  # seconds an idle connection is kept open
+# Seconds per attempt. Must exceed the API's worst case for /api/validate_batch, which is twice
+# its per-response scoring limit (SCORE_RESPONSE_TIMEOUT, 30s by default) plus some slack.
+API_REQUEST_TIMEOUT = 90
+API_RETRIES = 3  # attempts per request
+API_BACKOFF_BASE = 0.5  # seconds before the first retry, doubled on each further one
+
+
+class ValidatorAPIClient:
+    """
+    Long-lived client for the validator API.
+
+    All requests share one aiohttp session, whose connection pool keeps connections to the API
+    alive between forwards instead of redoing the TCP/TLS handshake per request. The auth
+    signature only depends on the hotkey, so it is computed once. Transient failures are retried
+    with jittered exponential backoff where that is safe, see request.
+    """
+
+    def __init__(
+        self, api_root: str, keypair, retries: int = API_RETRIES,
+        timeout: float = API_REQUEST_TIMEOUT, backoff_base: float = API_BACKOFF_BASE,
+    ):
+        self.api_root = api_root
+        self.retries = retries
+        self.timeout = timeout
+        self.backoff_base = backoff_base
+        hotkey = keypair.ss58_address
+        self.auth = aiohttp.BasicAuth(hotkey, f"0x{keypair.sign(hotkey).hex()}")
+        self.session: Optional[aiohttp.ClientSession] = None
+
+    def get_session(self) -> aiohttp.ClientSession:
+        # Created lazily, so it binds to the event loop the validator's forwards run on.
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=API_CONNECTION_LIMIT, keepalive_timeout=API_KEEPALIVE_TIMEOUT),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                auth=self.auth,
+            )
+        return self.session
+
+    async def request(self, method: str, path: str, **kwargs):
+        """
+        Sends the request and returns the decoded JSON response. Failures to connect are always
+        retried, since nothing reached the server. Timeouts, dropped connections and 5xx
+        responses are only retried for GET: scoring upserts the submitted videos, so replaying a
+        POST that the server may have finished would score them against their own copies.
+        """
+        idempotent = method == "GET"
+        for attempt in range(self.retries):
+            try:
+                async with self.get_session().request(method, f"{self.api_root}{path}", **kwargs) as response:
+                    if response.status < 500 or not idempotent:
+                        response.raise_for_status()
+                        return await response.json()
+                    error = f"HTTP {response.status}"
+            except aiohttp.ClientConnectorError as e:
+                error = repr(e)
+            except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError) as e:
+                if not idempotent:
+                    raise
+                error = repr(e)
+            if attempt + 1 < self.retries:
+                backoff = self.backoff_base * 2 ** attempt * (1 + random.random())
+                bt.logging.warning(f"{method} {path} failed ({error}), retrying in {backoff:.1f}s")
+                await asyncio.sleep(backoff)
+        raise RuntimeError(f"{method} {path} failed after {self.retries} attempts: {error}")
+
+    async def get_topic(self) -> str:
+        return await self.request("GET", "/api/topic")
+
+    async def validate_batch(self, input_synapse: Videos, responses: List[Videos]) -> List[Optional[float]]:
+        """Scores all the responses to one query in a single request; None for a response the API failed to score."""
+        batch = VideosBatch.from_responses(input_synapse, responses)
+        return await self.request("POST", "/api/validate_batch", json=batch.to_serializable_dict())
+
+    async def close(self) -> None:
+        if self.session is not None:
+            await self.session.close()
@@ -0,0 +1,149 @@
+import os
+import shutil
+import threading
+from typing import List, Optional
+
+VIDEO_CACHE_DIR = os.getenv("OMEGA_VIDEO_CACHE_DIR", os.path.expanduser("~/.cache/omega/videos"))
+VIDEO_CACHE_MAX_BYTES = int(float(os.getenv("OMEGA_VIDEO_CACHE_MAX_GB", "2")) * 1024 ** 3)  # 0 disables the cache
+FULL_VIDEO = "full"
+
+
+class CacheEntry:
+    def __init__(self, path: str, start: Optional[int], end: Optional[int]):
+        self.path = path
+        self.start = start
+        self.end = end
+
+    @property
+    def is_full(self) -> bool:
+        return self.start is None
+
+    def covers(self, start: Optional[int], end: Optional[int]) -> bool:
+        if self.is_full:
+            return True
+        if start is None or end is None:
+            return False
+        return self.start <= start and end <= self.end
+
+
+class VideoCache:
+    """
+    Downloaded videos on local disk, keyed by (video_id, start, end), so a clip that is
+    requested again (by the miner for another query, or by a validator spot check) is not
+    fetched from YouTube a second time.
+
+    Entries are written to a temporary file and moved into place with os.replace, so readers
+    in other processes never see a partial file. A request for (start, end) is served by an
+    exact entry, or else by any cached entry whose range contains it; the caller then clips
+    the narrower range out of it. Total size is kept under `max_bytes` by evicting the least
+    recently used entries (hits refresh the file mtime).
+    """
+
+    def __init__(self, cache_dir: str = VIDEO_CACHE_DIR, max_bytes: int = VIDEO_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.range_hits = 0
+        self.misses = 0
+        if self.enabled:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def entry_path(self, video_id: str, start: Optional[int], end: Optional[int]) -> str:
+        key = FULL_VIDEO if start is None or end is None else f"{start}-{end}"
+        return os.path.join(self.cache_dir, f"{video_id}.{key}.mp4")
+
+    def entries(self, video_id: str) -> List[CacheEntry]:
+        prefix = f"{video_id}."
+        entries = []
+        for filename in os.listdir(self.cache_dir):
+            if not filename.startswith(prefix) or not filename.endswith(".mp4"):
+                continue
+            key = filename[len(prefix):-len(".mp4")]
+            path = os.path.join(self.cache_dir, filename)
+            if key == FULL_VIDEO:
+                entries.append(CacheEntry(path, None, None))
+                continue
+            try:
+                start, end = (int(t) for t in key.split("-"))
+            except ValueError:
+                continue
+            entries.append(CacheEntry(path, start, end))
+        return entries
+
+    def lookup(self, video_id: str, start: Optional[int], end: Optional[int]) -> Optional[CacheEntry]:
+        """
+        Returns the cached entry to serve (start, end) from, preferring an exact match and then
+        the narrowest entry that contains the range, or None on a miss.
+        """
+        if not self.enabled:
+            return None
+        exact_path = self.entry_path(video_id, start, end)
+        candidates = [entry for entry in self.entries(video_id) if entry.covers(start, end)]
+        if len(candidates) == 0:
+            self.misses += 1
+            return None
+        exact = [entry for entry in candidates if entry.path == exact_path]
+        if exact:
+            self.hits += 1
+            entry = exact[0]
+        else:
+            self.range_hits += 1
+            entry = min(candidates, key=lambda e: float("inf") if e.is_full else e.end - e.start)
+        try:
+            os.utime(entry.path)
+        except FileNotFoundError:
+            return None  # evicted by another process in the meantime
+        return entry
+
+    def put(self, video_id: str, start: Optional[int], end: Optional[int], source_path: str) -> None:
+        if not self.enabled:
+            return
+        path = self.entry_path(video_id, start, end)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            shutil.copyfile(source_path, tmp_path)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Error caching video {video_id}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self.evict()
+
+    def evict(self) -> None:
+        with self.lock:
+            files = []
+            for filename in os.listdir(self.cache_dir):
+                if not filename.endswith(".mp4"):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(self.cache_dir, filename))
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, filename))
+            total = sum(size for _, size, _ in files)
+            for _, size, filename in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(self.cache_dir, filename))
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+    def stats(self) -> dict:
+        total = self.hits + self.range_hits + self.misses
+        return {
+            "hits": self.hits,
+            "range_hits": self.range_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.range_hits) / total if total else 0.0,
+        }
+
+
+video_cache = VideoCache()
@@ -0,0 +1,107 @@
+import asyncio
+import queue
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import bittensor as bt
+
+from omega import video_utils
+
+
+SEARCH_WORKERS = 4  # YoutubeDL instances, i.e. concurrent searches
+SEARCH_PAGE_SIZE = 20  # one YouTube results page; smaller requests are served from its cache entry
+SEARCH_CACHE_TTL = 30 * 60  # seconds
+SEARCH_CACHE_SIZE = 512  # queries
+
+
+class SearchService:
+    """
+    Asynchronous YouTube search for the miner.
+
+    Searches run on a thread pool, each borrowing one of `workers` long-lived YoutubeDL
+    instances (and with it, their HTTP session) instead of building a new one per request.
+    Every search fetches at least `page_size` results and caches them per query for `ttl`
+    seconds, so a repeated query, or a later request for the same query with a different
+    over-fetch, is answered from memory. Concurrent searches for the same query share one fetch.
+    """
+
+    def __init__(
+        self, workers: int = SEARCH_WORKERS, page_size: int = SEARCH_PAGE_SIZE,
+        ttl: float = SEARCH_CACHE_TTL, max_size: int = SEARCH_CACHE_SIZE,
+    ):
+        self.page_size = page_size
+        self.ttl = ttl
+        self.max_size = max_size
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="search")
+        self.extractors: "queue.Queue[video_utils.YoutubeDL]" = queue.Queue()
+        for _ in range(workers):
+            self.extractors.put(video_utils.YoutubeDL(dict(video_utils.SEARCH_OPTS)))
+        # query -> (fetched at, number requested, results)
+        self.cache: "OrderedDict[str, Tuple[float, int, List[video_utils.YoutubeResult]]]" = OrderedDict()
+        self.in_flight: Dict[Tuple[str, int], asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, query: str, max_results: int) -> Optional[List[video_utils.YoutubeResult]]:
+        entry = self.cache.get(query)
+        if entry is None:
+            return None
+        fetched_at, requested, results = entry
+        if time.time() - fetched_at > self.ttl:
+            del self.cache[query]
+            return None
+        # A fetch that came back short has every result there is, so it serves any request.
+        if max_results > requested and len(results) >= requested:
+            return None
+        self.cache.move_to_end(query)
+        return [result.copy() for result in results[:max_results]]
+
+    def fetch(self, query: str, max_results: int) -> List[video_utils.YoutubeResult]:
+        ydl = self.extractors.get()
+        try:
+            return video_utils.extract_search_results(ydl, query, max_results)
+        finally:
+            self.extractors.put(ydl)
+
+    async def search(self, query: str, max_results: int) -> List[video_utils.YoutubeResult]:
+        results = self.lookup(query, max_results)
+        if results is not None:
+            self.hits += 1
+            return results
+        self.misses += 1
+
+        fetch_size = max(max_results, self.page_size)
+        key = (query, fetch_size)
+        future = self.in_flight.get(key)
+        owner = future is None
+        if owner:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self.executor, self.fetch, query, fetch_size)
+            self.in_flight[key] = future
+        try:
+            results = await asyncio.shield(future)
+        except Exception as e:
+            bt.logging.warning(f"Error searching for videos: {e}")
+            return []
+        finally:
+            if owner:
+                self.in_flight.pop(key, None)
+
+        if owner:
+            self.cache[query] = (time.time(), fetch_size, results)
+            self.cache.move_to_end(query)
+            while len(self.cache) > self.max_size:
+                self.cache.popitem(last=False)
+        # Copies, so a caller changing its results does not change what later cache hits see.
+        return [result.copy() for result in results[:max_results]]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "cached_queries": len(self.cache),
+        }
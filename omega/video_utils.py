@@ -1,13 +1,28 @@
+import math
 import os
+import shutil
+import subprocess
 import tempfile
-from typing import Optional, BinaryIO
+import threading
+from fractions import Fraction
+from typing import Callable, List, Optional, BinaryIO, Tuple
 
 import bittensor as bt
 import ffmpeg
+import numpy as np
 from pydantic import BaseModel
 from yt_dlp import YoutubeDL
 
 from omega.constants import FIVE_MINUTES
+from omega.video_cache import video_cache
+
+
+# Intermediate media files up to this size are kept in memory (memfd or /dev/shm), larger ones
+# go to a temp file on disk. 0 keeps everything on disk.
+IN_MEMORY_MAX_BYTES = int(float(os.getenv("OMEGA_IN_MEMORY_MAX_MB", "256")) * 1024 ** 2)
+
+# Overridable so downloads can be pointed at a local HTTP server serving <video_id> files.
+VIDEO_URL_TEMPLATE = os.getenv("OMEGA_VIDEO_URL_TEMPLATE", "https://www.youtube.com/watch?v={video_id}")
 
 
 def seconds_to_str(seconds):
@@ -17,15 +32,58 @@ def seconds_to_str(seconds):
     return f"{hours:02}:{minutes:02}:{seconds:02}"
 
 
+class MemoryFile:
+    """
+    Anonymous in-memory file (memfd) standing in for a NamedTemporaryFile: other processes,
+    like ffmpeg, open it through `name`, and close() releases the memory. Like a
+    NamedTemporaryFile, it is also released when garbage collected.
+    """
+
+    fd: Optional[int] = None
+
+    def __init__(self, suffix: str = ""):
+        self.fd = os.memfd_create(f"omega{suffix}")
+        self.name = f"/proc/{os.getpid()}/fd/{self.fd}"
+
+    def close(self) -> None:
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def __del__(self) -> None:
+        self.close()
+
+    def __enter__(self) -> "MemoryFile":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+def media_tempfile(suffix: str, expected_size: int) -> BinaryIO:
+    """Temporary file for an intermediate of about `expected_size` bytes, in memory when it is small enough."""
+    if expected_size <= IN_MEMORY_MAX_BYTES:
+        if hasattr(os, "memfd_create"):
+            return MemoryFile(suffix)
+        if os.path.isdir("/dev/shm"):
+            return tempfile.NamedTemporaryFile(suffix=suffix, dir="/dev/shm")
+    return tempfile.NamedTemporaryFile(suffix=suffix)
+
+
 def clip_video(video_path: str, start: int, end: int) -> Optional[BinaryIO]:
-    temp_fileobj = tempfile.NamedTemporaryFile(suffix=".mp4")
-    (
-        ffmpeg
-        .input(video_path, ss=seconds_to_str(start), to=seconds_to_str(end))
-        .output(temp_fileobj.name, c="copy")  # copy flag prevents decoding and re-encoding
-        .overwrite_output()
-        .run(quiet=True)
-    )
+    # A stream copied clip is no larger than its source
+    temp_fileobj = media_tempfile(".mp4", os.path.getsize(video_path))
+    try:
+        (
+            ffmpeg
+            .input(video_path, ss=seconds_to_str(start), to=seconds_to_str(end))
+            .output(temp_fileobj.name, c="copy", f="mp4")  # copy flag prevents decoding and re-encoding
+            .overwrite_output()
+            .run(quiet=True)
+        )
+    except Exception:
+        temp_fileobj.close()
+        raise
     return temp_fileobj
 
 
@@ -47,34 +105,40 @@ class YoutubeResult(BaseModel):
     views: int
 
 
+SEARCH_OPTS = {
+    "format": "worst",
+    "dumpjson": True,
+    "extract_flat": True,
+    "quiet": True,
+    "simulate": True,
+    "match_filter": skip_live,
+}
+
+
+def extract_search_results(ydl: YoutubeDL, query: str, max_results: int) -> List[YoutubeResult]:
+    """Run a `ytsearch` with an existing YoutubeDL instance, raising on errors."""
+    search_query = f"ytsearch{max_results}:{query}"
+    result = ydl.extract_info(search_query, download=False)
+    if "entries" not in result or not result["entries"]:
+        return []
+    return [
+        YoutubeResult(
+            video_id=entry["id"],
+            title=entry["title"],
+            description=entry.get("description"),
+            length=(int(entry.get("duration")) if entry.get("duration") else FIVE_MINUTES),
+            views=(entry.get("view_count") if entry.get("view_count") else 0),
+        ) for entry in result["entries"]
+    ]
+
+
 def search_videos(query, max_results=8):
-    videos = []
-    ydl_opts = {
-        "format": "worst",
-        "dumpjson": True,
-        "extract_flat": True,
-        "quiet": True,
-        "simulate": True,
-        "match_filter": skip_live,
-    }
-    with YoutubeDL(ydl_opts) as ydl:
+    with YoutubeDL(dict(SEARCH_OPTS)) as ydl:
         try:
-            search_query = f"ytsearch{max_results}:{query}"
-            result = ydl.extract_info(search_query, download=False)
-            if "entries" in result and result["entries"]:
-                videos = [
-                    YoutubeResult(
-                        video_id=entry["id"],
-                        title=entry["title"],
-                        description=entry.get("description"),
-                        length=(int(entry.get("duration")) if entry.get("duration") else FIVE_MINUTES),
-                        views=(entry.get("view_count") if entry.get("view_count") else 0),
-                    ) for entry in result["entries"]
-                ]
+            return extract_search_results(ydl, query, max_results)
         except Exception as e:
             bt.logging.warning(f"Error searching for videos: {e}")
             return []
-    return videos
 
 
 def get_video_duration(filename: str) -> int:
@@ -89,10 +153,44 @@ class IPBlockedException(Exception):
         super().__init__(message)
 
 
+def get_cached_video(video_id: str, start: Optional[int]=None, end: Optional[int]=None) -> Optional[BinaryIO]:
+    """Serves the clip from the download cache, clipping it out of a wider cached range if needed."""
+    entry = video_cache.lookup(video_id, start, end)
+    if entry is None:
+        return None
+    try:
+        if start is None or end is None or (entry.start == start and entry.end == end):
+            temp_fileobj = media_tempfile(".mp4", os.path.getsize(entry.path))
+            try:
+                shutil.copyfile(entry.path, temp_fileobj.name)
+            except Exception:
+                temp_fileobj.close()
+                raise
+            return temp_fileobj
+        offset = entry.start or 0
+        return clip_video(entry.path, start - offset, end - offset)
+    except Exception as e:
+        # e.g. evicted between the lookup and the copy, fall back to downloading
+        print(f"Error reading cached video {video_id}: {e}")
+        return None
+
+
 def download_video(
     video_id: str, start: Optional[int]=None, end: Optional[int]=None, proxy: Optional[str]=None
 ) -> Optional[BinaryIO]:
-    video_url = f"https://www.youtube.com/watch?v={video_id}"
+    cached = get_cached_video(video_id, start, end)
+    if cached is not None:
+        return cached
+    video = download_youtube_video(video_id, start, end, proxy)
+    if video is not None:
+        video_cache.put(video_id, start, end, video.name)
+    return video
+
+
+def download_youtube_video(
+    video_id: str, start: Optional[int]=None, end: Optional[int]=None, proxy: Optional[str]=None
+) -> Optional[BinaryIO]:
+    video_url = VIDEO_URL_TEMPLATE.format(video_id=video_id)
     
     temp_fileobj = tempfile.NamedTemporaryFile(suffix=".mp4")
     ydl_opts = {
@@ -132,13 +230,106 @@ def download_video(
         return None
 
 
+class MediaData:
+    """Everything the embedding model needs from one video, decoded in a single pass."""
+
+    def __init__(self, duration: float, clip_frames: np.ndarray, waveform: np.ndarray):
+        self.duration = duration
+        self.clip_frames = clip_frames  # (num_clips, frames_per_clip, height, width, 3) uint8 RGB
+        self.waveform = waveform  # mono float32 samples
+
+
+def read_pipe(pipe: BinaryIO, chunks: List[bytes]) -> None:
+    while True:
+        chunk = pipe.read(1 << 20)
+        if not chunk:
+            return
+        chunks.append(chunk)
+
+
+def read_media(
+    video_path: str,
+    clip_timepoints_fn: Callable[[float], List[Tuple[float, float]]],
+    frames_per_clip: int = 2,
+    sample_rate: int = 16000,
+) -> MediaData:
+    """
+    Decode a video once, returning its duration, `frames_per_clip` evenly spaced RGB frames from
+    each (start, end) clip returned by `clip_timepoints_fn(duration)` and its first audio channel
+    as a float32 waveform at `sample_rate`.
+
+    After a metadata-only probe, a single ffmpeg process decodes the file, writing only the
+    selected frames as raw RGB to stdout and the PCM audio to a second pipe; both are read
+    concurrently into memory. Frames are picked the way ImageBind's video loader picks them:
+    the frames with timestamps in [start, end), subsampled uniformly.
+    """
+    metadata = ffmpeg.probe(video_path)
+    video_stream = next(stream for stream in metadata["streams"] if stream["codec_type"] == "video")
+    width, height = int(video_stream["width"]), int(video_stream["height"])
+    fps = float(Fraction(video_stream["avg_frame_rate"]))
+    duration = float(video_stream.get("duration") or metadata["format"]["duration"])
+    num_frames = int(video_stream.get("nb_frames") or 0) or max(int(duration * fps), 1)
+
+    clip_indices = []
+    for start, end in clip_timepoints_fn(duration):
+        first = min(math.ceil(start * fps), num_frames - 1)
+        last = max(min(math.ceil(end * fps), num_frames) - 1, first)
+        clip_indices.append(np.linspace(first, last, frames_per_clip).astype(np.int64))
+    wanted = sorted(set(int(i) for indices in clip_indices for i in indices))
+    select = "+".join(f"eq(n,{i})" for i in wanted)
+
+    audio_read, audio_write = os.pipe()
+    cmd = [
+        "ffmpeg", "-v", "error", "-nostdin", "-i", video_path,
+        "-map", "0:v:0", "-vf", f"select='{select}'", "-vsync", "0",
+        "-f", "rawvideo", "-pix_fmt", "rgb24", "pipe:1",
+        "-map", "0:a:0", "-af", "pan=mono|c0=c0", "-ar", str(sample_rate),
+        "-f", "f32le", "-acodec", "pcm_f32le", f"pipe:{audio_write}",
+    ]
+    try:
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, pass_fds=(audio_write,))
+    finally:
+        os.close(audio_write)
+    video_chunks, audio_chunks, err_chunks = [], [], []
+    with os.fdopen(audio_read, "rb") as audio_pipe:
+        readers = [
+            threading.Thread(target=read_pipe, args=(process.stdout, video_chunks)),
+            threading.Thread(target=read_pipe, args=(audio_pipe, audio_chunks)),
+            threading.Thread(target=read_pipe, args=(process.stderr, err_chunks)),
+        ]
+        for reader in readers:
+            reader.start()
+        for reader in readers:
+            reader.join()
+    if process.wait() != 0:
+        raise ffmpeg.Error("ffmpeg", b"", b"".join(err_chunks))
+
+    frame_bytes = width * height * 3
+    video = b"".join(video_chunks)
+    frames = np.frombuffer(video, dtype=np.uint8)[:len(video) // frame_bytes * frame_bytes]
+    frames = frames.reshape(-1, height, width, 3)
+    if len(frames) == 0:
+        raise ValueError(f"No frames decoded from {video_path}")
+    # Frames come out in index order; one past the real end of the stream maps to the last frame.
+    position = {index: min(i, len(frames) - 1) for i, index in enumerate(wanted)}
+    clip_frames = np.stack([frames[[position[int(i)] for i in indices]] for indices in clip_indices])
+    waveform = np.frombuffer(b"".join(audio_chunks), dtype=np.float32).copy()  # writable, the mel transform works in place
+    return MediaData(duration, clip_frames, waveform)
+
+
+
 def copy_audio(video_path: str) -> BinaryIO:
-    temp_audiofile = tempfile.NamedTemporaryFile(suffix=".aac")
-    (
-        ffmpeg
-        .input(video_path)
-        .output(temp_audiofile.name, vn=None, acodec='copy')
-        .overwrite_output()
-        .run(quiet=True)
-    )
+    """Copies the audio stream out of the video, for loaders that read audio files (see load_reference_inputs)."""
+    temp_audiofile = media_tempfile(".aac", os.path.getsize(video_path))
+    try:
+        (
+            ffmpeg
+            .input(video_path)
+            .output(temp_audiofile.name, vn=None, acodec='copy', f="adts")
+            .overwrite_output()
+            .run(quiet=True)
+        )
+    except Exception:
+        temp_audiofile.close()
+        raise
     return temp_audiofile
@@ -2,7 +2,7 @@ import asyncio
 import os
 from datetime import datetime
 import time
-from typing import Annotated, List
+from typing import Annotated, List, Optional
 import random
 
 import bittensor
@@ -12,12 +12,13 @@ from fastapi.security import HTTPBasicCredentials, HTTPBasic
 from starlette import status
 from substrateinterface import Keypair
 
-from omega.protocol import Videos
+from omega.protocol import Videos, VideosBatch
 from omega.imagebind_wrapper import ImageBind
 
 from validator_api import score
 from validator_api.config import TOPICS_LIST, IS_PROD
 from validator_api.dataset_upload import dataset_uploader
+from validator_api.query_cache import query_embedding_cache
 
 
 NETWORK = os.environ["NETWORK"]
@@ -46,6 +47,8 @@ async def main():
     subtensor = bittensor.subtensor(network=NETWORK)
     metagraph: bittensor.metagraph = subtensor.metagraph(NETUID)
 
+    query_embedding_cache.warm(imagebind, TOPICS_LIST)
+
     async def resync_metagraph():
         while True:
             """Resyncs the metagraph and updates the hotkeys and moving averages based on the new metagraph."""
@@ -58,13 +61,10 @@ async def main():
 
     @app.on_event("shutdown")
     async def shutdown_event():
-        dataset_uploader.submit()
+        # close() blocks on the upload queue and joins the worker, so keep it off the event loop.
+        await asyncio.get_running_loop().run_in_executor(None, dataset_uploader.close)
 
-    @app.post("/api/validate")
-    async def validate(
-        videos: Videos,
-        hotkey: Annotated[str, Depends(get_hotkey)],
-    ) -> float:
+    def get_validator_uid(hotkey: str) -> int:
         if hotkey not in metagraph.hotkeys:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
@@ -79,11 +79,32 @@ async def main():
                 detail="Validator permit required",
             )
 
+        return uid
+
+    @app.post("/api/validate")
+    async def validate(
+        videos: Videos,
+        hotkey: Annotated[str, Depends(get_hotkey)],
+    ) -> float:
+        uid = get_validator_uid(hotkey)
+
         start_time = time.time()
         computed_score = await score.score_and_upload_videos(videos, imagebind)
         print(f"Returning score={computed_score} for validator={uid} in {time.time() - start_time:.2f}s")
         return computed_score
 
+    @app.post("/api/validate_batch")
+    async def validate_batch(
+        batch: VideosBatch,
+        hotkey: Annotated[str, Depends(get_hotkey)],
+    ) -> List[Optional[float]]:
+        uid = get_validator_uid(hotkey)
+
+        start_time = time.time()
+        computed_scores = await score.score_and_upload_videos_batch(batch, imagebind)
+        print(f"Returning {len(computed_scores)} scores for validator={uid} in {time.time() - start_time:.2f}s")
+        return computed_scores
+
     if not IS_PROD:
         @app.get("/api/count_unique")
         async def count_unique(
@@ -99,6 +120,18 @@ async def main():
             detailed_score = await score.score_videos_for_testing(videos, imagebind)
             return detailed_score
 
+        @app.get("/api/query_cache_stats")
+        async def query_cache_stats() -> dict:
+            return query_embedding_cache.stats()
+
+        @app.get("/api/stage_latencies")
+        async def stage_latencies() -> dict:
+            return score.STAGE_LATENCIES.summary()
+
+        @app.get("/api/batch_stats")
+        async def batch_stats() -> dict:
+            return score.get_scoring_batcher(imagebind).stats()
+
     @app.get("/api/topic")
     async def get_topic() -> str:
         return random.choice(TOPICS_LIST)
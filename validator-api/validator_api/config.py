@@ -11,8 +11,13 @@ def parse_proxies(proxy_list: List[str]) -> List[str]:
     return transformed_proxies
 
 
-PINECONE_API_KEY = os.environ["PINECONE_API_KEY"]
-PINECONE_INDEX = os.environ["PINECONE_INDEX"]
+VECTOR_STORE = os.environ.get("VECTOR_STORE", "pinecone")  # pinecone, local or memory
+PINECONE_API_KEY = os.environ.get("PINECONE_API_KEY")
+PINECONE_INDEX = os.environ.get("PINECONE_INDEX")
+LOCAL_INDEX_PATH = os.environ.get("LOCAL_INDEX_PATH", "./cache/vector_index")
+LOCAL_INDEX_DTYPE = os.environ.get("LOCAL_INDEX_DTYPE", "float16")
+LOCAL_INDEX_NLIST = int(os.environ.get("LOCAL_INDEX_NLIST", 1024))
+LOCAL_INDEX_NPROBE = int(os.environ.get("LOCAL_INDEX_NPROBE", 8))
 HF_TOKEN = os.environ["HF_TOKEN"]
 HF_REPO = os.environ["HF_REPO"]
 REPO_TYPE = "dataset"
@@ -21,3 +26,15 @@ PROXY_LIST = parse_proxies(json.loads(os.environ["PROXY_LIST"]))
 IS_PROD = os.environ.get("IS_PROD", "false").lower() == "true"
 CHECK_PROBABILITY = float(os.environ.get("CHECK_PROBABILITY", 0.1))
 UPLOAD_BATCH_SIZE = int(os.environ.get("UPLOAD_BATCH_SIZE", 1024))
+UPLOAD_QUEUE_SIZE = int(os.environ.get("UPLOAD_QUEUE_SIZE", 4))  # batches waiting in memory for upload
+UPLOAD_SPILL_DIR = os.environ.get("UPLOAD_SPILL_DIR", "./cache/upload_spill")
+UPLOAD_COMPRESSION = os.environ.get("UPLOAD_COMPRESSION", "zstd")
+# float64 keeps the schema of the batches already in the dataset; float32 / float16 shrink uploads.
+UPLOAD_EMBEDDING_DTYPE = os.environ.get("UPLOAD_EMBEDDING_DTYPE", "float64")
+QUERY_CACHE_SIZE = int(os.environ.get("QUERY_CACHE_SIZE", 1024))
+# Concurrent scoring requests are batched for the GPU: a batch waits this long for more requests.
+SCORE_BATCH_WAIT = float(os.environ.get("SCORE_BATCH_WAIT_MS", 5)) / 1000
+SCORE_BATCH_SIZE = int(os.environ.get("SCORE_BATCH_SIZE", 64))  # texts / submissions per batch
+# Each response in a /api/validate_batch request is scored under this limit, so one slow miner
+# cannot hold up the rest. Keep it well under the validator client's API_REQUEST_TIMEOUT.
+SCORE_RESPONSE_TIMEOUT = float(os.environ.get("SCORE_RESPONSE_TIMEOUT", 30))
@@ -1,78 +1,282 @@
 from io import BytesIO
-from typing import List
+import os
+import queue
+import threading
+import time
+from typing import List, Optional
 from datetime import datetime
 
-from datasets import Dataset
 from huggingface_hub import HfApi
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 import ulid
 
+from omega.constants import EMBEDDING_DIM
 from omega.protocol import VideoMetadata
 
 from validator_api import config
 
 
 HF_API = HfApi()
+UPLOAD_MAX_RETRIES = 5
+UPLOAD_BACKOFF_SECONDS = 2
+EMBEDDING_COLUMNS = ["video_embed", "audio_embed", "description_embed"]
+STRING_COLUMNS = ["video_id", "youtube_id", "description", "query"]
+INT_COLUMNS = ["views", "start_time", "end_time", "submitted_at"]
+FLOAT_COLUMNS = ["description_relevance_score", "query_relevance_score"]
+PARTIAL_SUFFIX = ".parquet.partial"  # spilled by close() for being too small to upload on its own
+COLUMN_ORDER = [
+    "video_id", "youtube_id", "description", "views", "start_time", "end_time",
+    "video_embed", "audio_embed", "description_embed",
+    "description_relevance_score", "query_relevance_score", "query", "submitted_at",
+]
 
 
 def get_data_path(batch_id: str) -> str:
     return f"default/train/{batch_id}.parquet"
 
 
+class ColumnarBatch:
+    """
+    Column buffers for up to `capacity` dataset rows. Embeddings are written straight into
+    preallocated float32 matrices and scalars into per-column lists, so a batch never holds a
+    dict or a boxed float per value and converts to an Arrow table without a row-wise copy.
+    """
+
+    def __init__(self, capacity: int, dim: int = EMBEDDING_DIM):
+        self.capacity = capacity
+        self.size = 0
+        self.embeddings = {column: np.empty((capacity, dim), dtype=np.float32) for column in EMBEDDING_COLUMNS}
+        self.scalars = {column: [] for column in STRING_COLUMNS + INT_COLUMNS + FLOAT_COLUMNS}
+
+    def __len__(self) -> int:
+        return self.size
+
+    def append(
+        self, video_id: str, video: VideoMetadata, embeddings: np.ndarray,
+        description_relevance_score: float, query_relevance_score: float, query: str, submitted_at: int,
+    ) -> None:
+        """Appends one row; `embeddings` is the video's (3, d) row of the submission's embedding matrix."""
+        assert self.size < self.capacity
+        self.embeddings["video_embed"][self.size] = embeddings[0]
+        self.embeddings["audio_embed"][self.size] = embeddings[1]
+        self.embeddings["description_embed"][self.size] = embeddings[2]
+        for column, value in (
+            ("video_id", video_id),
+            ("youtube_id", video.video_id),
+            ("description", video.description),
+            ("views", video.views),
+            ("start_time", video.start_time),
+            ("end_time", video.end_time),
+            ("description_relevance_score", description_relevance_score),
+            ("query_relevance_score", query_relevance_score),
+            ("query", query),
+            ("submitted_at", submitted_at),
+        ):
+            self.scalars[column].append(value)
+        self.size += 1
+
+    def extend(self, table: pa.Table, start: int = 0) -> int:
+        """Appends the rows of a to_table table from row `start` on, as many as fit. Returns how many."""
+        table = table.slice(start, min(self.capacity - self.size, table.num_rows - start))
+        end = self.size + table.num_rows
+        for column in EMBEDDING_COLUMNS:
+            values = table.column(column).combine_chunks().flatten().to_numpy(zero_copy_only=False)
+            self.embeddings[column][self.size:end] = values.reshape(table.num_rows, -1)
+        for column in self.scalars:
+            self.scalars[column].extend(table.column(column).to_pylist())
+        self.size = end
+        return table.num_rows
+
+    def to_table(self, embedding_dtype: str) -> pa.Table:
+        columns = {}
+        for column in STRING_COLUMNS:
+            columns[column] = pa.array(self.scalars[column], type=pa.string())
+        for column in INT_COLUMNS:
+            columns[column] = pa.array(self.scalars[column], type=pa.int64())
+        for column in FLOAT_COLUMNS:
+            columns[column] = pa.array(self.scalars[column], type=pa.float64())
+        for column in EMBEDDING_COLUMNS:
+            values = self.embeddings[column][:self.size].astype(embedding_dtype, copy=False)
+            dim = values.shape[1]
+            columns[column] = pa.ListArray.from_arrays(
+                pa.array(np.arange(0, (self.size + 1) * dim, dim, dtype=np.int32)),
+                pa.array(values.reshape(-1)),
+            )
+        return pa.table({column: columns[column] for column in COLUMN_ORDER})
+
+
 class DatasetUploader:
+    """
+    Buffers scored videos and uploads them to Hugging Face in parquet batches.
+
+    Requests only append rows. Full batches are handed to a background worker through a bounded
+    queue; the worker serializes and uploads them, retrying with exponential backoff. A batch
+    that cannot be queued (queue full) or uploaded (retries exhausted) is spilled to disk in
+    `config.UPLOAD_SPILL_DIR` and uploaded later, so buffered memory stays capped and no batch
+    is dropped. Rows still buffered at shutdown are spilled separately and merged back into the
+    buffer at the next startup, so they are only uploaded as part of a batch of the minimum size.
+    """
+
     def __init__(self):
-        self.current_batch = []
         self.desired_batch_size = config.UPLOAD_BATCH_SIZE
+        self.current_batch = self.new_batch()
         self.min_batch_size = 32
+        self.lock = threading.Lock()  # add_videos is called from the scoring executor threads
+        self.spill_dir = config.UPLOAD_SPILL_DIR
+        os.makedirs(self.spill_dir, exist_ok=True)
+        self.queue: "queue.Queue[Optional[ColumnarBatch]]" = queue.Queue(maxsize=config.UPLOAD_QUEUE_SIZE)
+        self.worker = threading.Thread(target=self.run, name="dataset-upload", daemon=True)
+        self.worker.start()
 
     def add_videos(
-        self, metadata: List[VideoMetadata], video_ids: List[str],
+        self, metadata: List[VideoMetadata], video_ids: List[str], embeddings: np.ndarray,
         description_relevance_scores: List[float], query_relevance_scores: List[float],
         query: str,
     ) -> None:
-        curr_time = datetime.now()
-        self.current_batch.extend([
-            {
-                "video_id": vid_uuid,
-                "youtube_id": video.video_id,
-                "description": video.description,
-                "views": video.views,
-                "start_time": video.start_time,
-                "end_time": video.end_time,
-                "video_embed": video.video_emb,
-                "audio_embed": video.audio_emb,
-                "description_embed": video.description_emb,
-                "description_relevance_score": desc_score,
-                "query_relevance_score": query_score,
-                "query": query,
-                "submitted_at": int(curr_time.timestamp()),
-            }
-            for vid_uuid, video, desc_score, query_score
-            in zip(video_ids, metadata, description_relevance_scores, query_relevance_scores)
-        ])
-        print(f"Added {len(metadata)} videos to batch, now have {len(self.current_batch)}")
-        if len(self.current_batch) >= self.desired_batch_size:
-            self.submit()
+        submitted_at = int(datetime.now().timestamp())
+        full_batches = []
+        with self.lock:
+            for vid_uuid, video, video_embeddings, desc_score, query_score in zip(
+                video_ids, metadata, embeddings, description_relevance_scores, query_relevance_scores
+            ):
+                self.current_batch.append(
+                    vid_uuid, video, video_embeddings, desc_score, query_score, query, submitted_at
+                )
+                if len(self.current_batch) >= min(self.desired_batch_size, self.current_batch.capacity):
+                    full_batches.append(self.current_batch)
+                    self.current_batch = self.new_batch()
+            print(f"Added {len(metadata)} videos to batch, now have {len(self.current_batch)}")
+        for batch in full_batches:
+            self.enqueue(batch)
+
+    def new_batch(self) -> ColumnarBatch:
+        return ColumnarBatch(self.desired_batch_size)
 
     def submit(self) -> None:
-        if len(self.current_batch) < self.min_batch_size:
-            print(f"Need at least {self.min_batch_size} videos to submit, but have {len(self.current_batch)}")
-            return
-        data = self.current_batch[:self.desired_batch_size]
-        print(f"Uploading batch of {len(self.current_batch)} videos")
+        """Hands the buffered rows to the upload worker without waiting for the upload."""
+        with self.lock:
+            if len(self.current_batch) < self.min_batch_size:
+                print(f"Need at least {self.min_batch_size} videos to submit, but have {len(self.current_batch)}")
+                return
+            batch, self.current_batch = self.current_batch, self.new_batch()
+        self.enqueue(batch)
+
+    def enqueue(self, batch: ColumnarBatch) -> None:
+        try:
+            self.queue.put_nowait(batch)
+            print(f"Queued batch of {len(batch)} videos for upload")
+        except queue.Full:
+            print(f"Upload queue is full, spilling batch of {len(batch)} videos to disk")
+            self.spill(self.serialize(batch))
+
+    def close(self, timeout: float = 60) -> None:
+        """
+        Queues what is buffered, keeping a batch too small to upload for the next startup (see
+        restore_partial), then waits for the worker. Blocks, so call it off the event loop.
+        """
+        self.submit()
+        with self.lock:
+            batch, self.current_batch = self.current_batch, self.new_batch()
+        if len(batch) > 0:
+            self.spill(self.serialize(batch), suffix=PARTIAL_SUFFIX)
+        self.queue.put(None)
+        self.worker.join(timeout)
+
+    def restore_partial(self) -> None:
+        """Merges the rows close() kept back at the last shutdown into the buffer."""
+        full_batches = []
+        for filename in sorted(os.listdir(self.spill_dir)):
+            if not filename.endswith(PARTIAL_SUFFIX):
+                continue
+            path = os.path.join(self.spill_dir, filename)
+            table = pq.read_table(path)
+            with self.lock:
+                start = 0
+                while start < table.num_rows:
+                    start += self.current_batch.extend(table, start)
+                    if len(self.current_batch) >= self.current_batch.capacity:
+                        full_batches.append(self.current_batch)
+                        self.current_batch = self.new_batch()
+            os.remove(path)
+            print(f"Restored {table.num_rows} videos from {path}")
+        for batch in full_batches:
+            self.enqueue(batch)
+
+    def serialize(self, batch: ColumnarBatch) -> bytes:
         with BytesIO() as f:
-            dataset = Dataset.from_list(data)
-            num_bytes = dataset.to_parquet(f)
+            pq.write_table(
+                batch.to_table(config.UPLOAD_EMBEDDING_DTYPE), f, compression=config.UPLOAD_COMPRESSION
+            )
+            return f.getvalue()
+
+    def upload(self, parquet: bytes) -> bool:
+        for attempt in range(UPLOAD_MAX_RETRIES):
             try:
                 HF_API.upload_file(
-                    path_or_fileobj=f,
+                    path_or_fileobj=parquet,
                     path_in_repo=get_data_path(str(ulid.new())),
                     repo_id=config.HF_REPO,
                     repo_type=config.REPO_TYPE,
                 )
-                print(f"Uploaded {num_bytes} bytes to Hugging Face")
+                print(f"Uploaded {len(parquet)} bytes to Hugging Face")
+                return True
+            except Exception as e:
+                backoff = UPLOAD_BACKOFF_SECONDS * 2 ** attempt
+                print(f"Error uploading to Hugging Face (attempt {attempt + 1}/{UPLOAD_MAX_RETRIES}), retrying in {backoff}s: {e}")
+                time.sleep(backoff)
+        return False
+
+    def spill(self, parquet: bytes, suffix: str = ".parquet") -> None:
+        path = os.path.join(self.spill_dir, f"{ulid.new()}{suffix}")
+        with open(f"{path}.tmp", "wb") as f:
+            f.write(parquet)
+        os.replace(f"{path}.tmp", path)
+        print(f"Spilled {len(parquet)} bytes to {path}")
+
+    def upload_spilled(self) -> None:
+        for filename in sorted(os.listdir(self.spill_dir)):
+            if not filename.endswith(".parquet"):
+                continue
+            path = os.path.join(self.spill_dir, filename)
+            with open(path, "rb") as f:
+                parquet = f.read()
+            if not self.upload(parquet):
+                return  # still failing, keep the remaining files for the next attempt
+            os.remove(path)
+
+    def run(self) -> None:
+        try:
+            self.restore_partial()
+        except Exception as e:
+            print(f"Error restoring partial batches: {e}")
+        try:
+            self.upload_spilled()
+        except Exception as e:
+            print(f"Error uploading spilled batches: {e}")
+        while True:
+            batch = self.queue.get()
+            if batch is None:
+                return
+            # Guard every iteration: if the worker died, batches would pile up unnoticed.
+            parquet, uploaded = None, False
+            try:
+                print(f"Uploading batch of {len(batch)} videos")
+                parquet = self.serialize(batch)
+                uploaded = self.upload(parquet)
+                if uploaded:
+                    self.upload_spilled()
+                else:
+                    self.spill(parquet)
             except Exception as e:
-                print(f"Error uploading to Hugging Face: {e}")
-        self.current_batch = self.current_batch[self.desired_batch_size:]
+                print(f"Error in upload worker: {e}")
+                if uploaded:
+                    continue
+                try:
+                    self.spill(parquet if parquet is not None else self.serialize(batch))
+                except Exception as e:
+                    print(f"Dropping batch of {len(batch)} videos, failed to spill it: {e}")
 
 
 dataset_uploader = DatasetUploader()
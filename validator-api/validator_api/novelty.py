@@ -0,0 +1,67 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+import torch
+
+from omega.imagebind_wrapper import Embeddings
+
+from validator_api.score_kernel import DIFFERENCE_THRESHOLD, compute_novelty
+from validator_api.vector_store import VectorStore
+
+
+NOVELTY_QUERY_TIMEOUT = 5  # seconds per index lookup
+NOVELTY_WORKERS = 16
+
+
+class NoveltyEngine:
+    """
+    Issues the per-video nearest-neighbour lookups of a submission concurrently on a thread pool,
+    so they neither run serially nor block the event loop. Each lookup has its own timeout.
+    """
+
+    def __init__(self, index: VectorStore, timeout: float = NOVELTY_QUERY_TIMEOUT, max_workers: int = NOVELTY_WORKERS):
+        self.index = index
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="novelty")
+
+    async def query_match_score(self, vector: List[float], top_k: int, select_idx: int) -> Optional[float]:
+        """Similarity of the `select_idx`-th match, 0 if there is no such match, None on timeout."""
+        loop = asyncio.get_running_loop()
+        try:
+            response = await asyncio.wait_for(
+                loop.run_in_executor(self.executor, functools.partial(self.index.query, vector=vector, top_k=top_k)),
+                timeout=self.timeout,
+            )
+        except asyncio.TimeoutError:
+            print(f"WARNING: novelty lookup timed out after {self.timeout}s")
+            return None
+        matches = response["matches"]
+        if len(matches) <= select_idx:
+            return 0.0
+        return matches[select_idx]["score"]
+
+    async def query_match_scores(self, embeddings: Embeddings, already_uploaded: bool) -> torch.Tensor:
+        """
+        (n,) similarity of each video's closest match in the index, NaN where the lookup timed out.
+        Takes the top 2nd match from the index if the videos are already uploaded, cause the 1st
+        match is itself.
+        """
+        top_k = 2 if already_uploaded else 1
+        select_idx = 1 if already_uploaded else 0
+        match_scores = await asyncio.gather(*[
+            self.query_match_score(vector, top_k, select_idx)
+            for vector in embeddings.video.cpu().tolist()
+        ])
+        return torch.tensor([float("nan") if score is None else score for score in match_scores], dtype=torch.float32)
+
+    async def compute_novelty_score(self, embeddings: Embeddings, already_uploaded: bool) -> Tuple[float, List[bool]]:
+        """
+        Take the complement of the closest match score to be the novelty of each video, and sum
+        it over the videos that are not too similar to one in the index. A lookup that times out
+        counts as not novel, but does not mark the video as a duplicate.
+        """
+        match_scores = await self.query_match_scores(embeddings, already_uploaded)
+        novelty, is_too_similar = compute_novelty(match_scores)
+        return novelty[~is_too_similar].sum().item(), is_too_similar.tolist()
@@ -0,0 +1,74 @@
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import torch
+
+from omega.imagebind_wrapper import ImageBind
+
+from validator_api import config
+
+
+WARM_BATCH_SIZE = 64
+
+
+class QueryEmbeddingCache:
+    """
+    Text embeddings for validator queries. The topics served by /api/topic are embedded once
+    at startup and kept for the life of the process; any other query is embedded on demand
+    and kept in a bounded LRU.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.topics: Dict[str, torch.Tensor] = {}
+        self.recent: "OrderedDict[str, torch.Tensor]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def warm(self, imagebind: ImageBind, queries: List[str]) -> None:
+        for i in range(0, len(queries), WARM_BATCH_SIZE):
+            batch = queries[i:i + WARM_BATCH_SIZE]
+            embeddings = imagebind.embed_text(batch)
+            for query, embedding in zip(batch, embeddings):
+                self.topics[query] = embedding.unsqueeze(0)
+        print(f"Precomputed query embeddings for {len(self.topics)} topics")
+
+    def lookup(self, query: str) -> Optional[torch.Tensor]:
+        if query in self.topics:
+            self.hits += 1
+            return self.topics[query]
+        if query in self.recent:
+            self.hits += 1
+            self.recent.move_to_end(query)
+            return self.recent[query]
+        self.misses += 1
+        return None
+
+    def put(self, query: str, embedding: torch.Tensor) -> None:
+        if query in self.topics:
+            return
+        self.recent[query] = embedding
+        self.recent.move_to_end(query)
+        while len(self.recent) > self.max_size:
+            self.recent.popitem(last=False)
+
+    async def get(self, query: str, embed_text: Callable[[str], Awaitable[torch.Tensor]]) -> torch.Tensor:
+        """Returns the (1, d) embedding of the query, embedding it with `embed_text` on a miss."""
+        embedding = self.lookup(query)
+        if embedding is None:
+            embedding = await embed_text(query)
+            self.put(query, embedding)
+        return embedding
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "topics": len(self.topics),
+            "recent": len(self.recent),
+        }
+
+
+query_embedding_cache = QueryEmbeddingCache(config.QUERY_CACHE_SIZE)
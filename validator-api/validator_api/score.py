@@ -1,55 +1,52 @@
 import asyncio
+import functools
 import random
 import uuid
-from typing import List, Tuple, Optional, BinaryIO
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Tuple, Optional, BinaryIO
 
-from pinecone import Pinecone
+import numpy as np
 import torch
 import torch.nn.functional as F
 
-from omega.protocol import Videos, VideoMetadata
+from omega.protocol import Videos, VideosBatch, VideoMetadata, get_embedding_matrix
 from omega import video_utils
 from omega.constants import MAX_VIDEO_LENGTH, MIN_VIDEO_LENGTH
-from omega.imagebind_wrapper import ImageBind, Embeddings, run_async
+from omega.imagebind_wrapper import ImageBind, Embeddings, run_async, load_reference_inputs, EMBED_BATCH_SIZE
 
 from validator_api import config
 from validator_api.dataset_upload import dataset_uploader
+from validator_api.novelty import NoveltyEngine, DIFFERENCE_THRESHOLD
+from validator_api.vector_store import get_vector_store
+from validator_api.query_cache import query_embedding_cache
+from validator_api.score_kernel import pad_submissions, score_kernel
+from validator_api.timing import StageTimer, StageLatencies
 
 
-PINECONE_INDEX = Pinecone(api_key=config.PINECONE_API_KEY).Index(config.PINECONE_INDEX)
-DIFFERENCE_THRESHOLD = 0.05
+VECTOR_STORE = get_vector_store()
+NOVELTY_ENGINE = NoveltyEngine(VECTOR_STORE)
 SIMILARITY_THRESHOLD = 1 - DIFFERENCE_THRESHOLD
-GPU_SEMAPHORE = asyncio.Semaphore(1)
 DOWNLOAD_SEMAPHORE = asyncio.Semaphore(5)
 VIDEO_DOWNLOAD_TIMEOUT = 10
+IO_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="score-io")  # vector store, dataset, video decoding
+CPU_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="score-cpu")  # tensor building, math
+GPU_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="score-gpu")  # one batched forward pass at a time
+STAGE_LATENCIES = StageLatencies()
 
 
-def compute_novelty_score(embeddings: Embeddings, already_uploaded: bool) -> Tuple[float, List[bool]]:
-    """
-    Take the top 2nd match from the Pinecone index (cause the 1st match is itself) and then
-    take the complement of the score to be the novelty score.
-    """
-    top_k = 2 if already_uploaded else 1
-    select_idx = 1 if already_uploaded else 0
-    novelty_scores = [
-        1 - PINECONE_INDEX.query(
-            vector=embedding.tolist(),
-            top_k=top_k,
-        )["matches"][select_idx]["score"]
-        for embedding in embeddings.video
-    ]
-    is_too_similar = [score < DIFFERENCE_THRESHOLD for score in novelty_scores]
-    novelty_score = sum([
-        score for score, is_too_similar
-        in zip(novelty_scores, is_too_similar) if not is_too_similar
-    ])
-    return novelty_score, is_too_similar
+async def run_in_executor(executor: ThreadPoolExecutor, func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
+
 
+async def compute_novelty_score(embeddings: Embeddings, already_uploaded: bool) -> Tuple[float, List[bool]]:
+    return await NOVELTY_ENGINE.compute_novelty_score(embeddings, already_uploaded)
 
-def upload_to_pinecone(embeddings: Embeddings, metadata: List[VideoMetadata]) -> None:
+
+def upload_to_vector_store(embeddings: Embeddings, metadata: List[VideoMetadata]) -> None:
     video_ids = [str(uuid.uuid4()) for _ in range(len(metadata))]
     try:
-        PINECONE_INDEX.upsert(
+        VECTOR_STORE.upsert(
             vectors=[
                 {
                     "id": video_uuid,
@@ -62,26 +59,206 @@ def upload_to_pinecone(embeddings: Embeddings, metadata: List[VideoMetadata]) ->
             ],
         )
     except Exception as e:
-        print(f"Failed to upload to Pinecone: {e}")
+        print(f"Failed to upload to vector store: {e}")
     return video_ids
 
 
-def filter_embeddings(embeddings: Embeddings, is_too_similar: List[bool]) -> Embeddings:
-    """Filter the embeddings based on whether they are too similar to the query."""
-    is_too_similar = torch.tensor(is_too_similar)
-    embeddings.video = embeddings.video[~is_too_similar]
-    embeddings.audio = embeddings.audio[~is_too_similar]
-    embeddings.description = embeddings.description[~is_too_similar]
-    return embeddings
+def load_embeddings(metadata: List[VideoMetadata], device: str = "cpu") -> Tuple[np.ndarray, Embeddings]:
+    """
+    Decodes the submission once into a contiguous (n, 3, d) host matrix and returns it with
+    Embeddings views of the same data on `device`. On CPU the views share the host buffer; on
+    GPU the matrix is copied over in a single transfer.
+    """
+    matrix = get_embedding_matrix(metadata)
+    stacked = torch.from_numpy(matrix).to(device)
+    return matrix, Embeddings(
+        video=stacked[:, 0],
+        audio=stacked[:, 1],
+        description=stacked[:, 2],
+    )
+
+
+def score_submissions(submissions: List[Tuple[Embeddings, torch.Tensor, torch.Tensor, int]]) -> List[dict]:
+    """
+    Scores several (embeddings, query embedding, match scores, num_videos) submissions with one
+    score_kernel pass, then splits the result back per submission. The relevance scores of a
+    submission only cover its unique videos, in order.
+    """
+    video, mask = pad_submissions([embeddings.video for embeddings, _, _, _ in submissions])
+    description, _ = pad_submissions([embeddings.description for embeddings, _, _, _ in submissions])
+    match_scores, _ = pad_submissions(
+        [match_scores.to(video.device) for _, _, match_scores, _ in submissions], padding_value=float("nan")
+    )
+    query = torch.cat([query_emb for _, query_emb, _, _ in submissions]).to(video.device)
+    num_videos = torch.tensor([num_videos for _, _, _, num_videos in submissions], device=video.device)
+    result = score_kernel(video, description, query, match_scores, mask, num_videos)
+
+    # Move everything to the host at once, then split it up.
+    mask = mask.cpu()
+    kept = mask & ~result.is_too_similar.cpu()
+    description_relevance, query_relevance = result.description_relevance.cpu(), result.query_relevance.cpu()
+    novelty_scores, scores = result.novelty_scores.tolist(), result.scores.tolist()
+    return [
+        {
+            "is_unique": kept[i][mask[i]].tolist(),
+            "description_relevance_scores": description_relevance[i][kept[i]].tolist(),
+            "query_relevance_scores": query_relevance[i][kept[i]].tolist(),
+            "novelty_score": novelty_scores[i],
+            "score": scores[i],
+        }
+        for i in range(len(submissions))
+    ]
 
 
-def is_similar(emb_1: torch.Tensor, emb_2: List[float]) -> bool:
+def is_similar(emb_1: torch.Tensor, emb_2: np.ndarray) -> bool:
     return F.cosine_similarity(
         emb_1,
-        torch.tensor(emb_2, device=emb_1.device).unsqueeze(0)
+        torch.from_numpy(emb_2).to(emb_1.device).unsqueeze(0)
     ) > SIMILARITY_THRESHOLD
 
 
+def load_check_inputs(metadata: VideoMetadata, video_file: BinaryIO) -> dict:
+    """
+    Decodes a downloaded video into model inputs on the host, off the GPU executor. Uses
+    ImageBind's reference loaders, as miners do, not the faster read_media.
+    """
+    return load_reference_inputs([metadata.description], [video_file], "cpu")
+
+
+def check_videos(imagebind: ImageBind, items: List[Tuple[VideoMetadata, dict]]) -> List[bool]:
+    """
+    Embeds the decoded videos (see load_check_inputs) in one forward pass and checks that the
+    video, audio and description embeddings of each are all similar to the ones its miner submitted.
+    """
+    embeddings = imagebind.embed_inputs({
+        modality: torch.cat([inputs[modality] for _, inputs in items])
+        for modality in items[0][1]
+    })
+    computed = torch.stack([embeddings.video, embeddings.audio, embeddings.description], dim=1)
+    submitted = torch.from_numpy(get_embedding_matrix([metadata for metadata, _ in items])).to(computed.device)
+    similarity = F.cosine_similarity(computed, submitted, dim=2)
+    return (similarity > SIMILARITY_THRESHOLD).all(dim=1).tolist()
+
+
+class MicroBatcher:
+    """
+    Collects the items that concurrent requests submit for up to `max_wait` seconds (or until
+    `max_size` have queued), runs `process` on all of them at once on `executor`, and resolves
+    each request with its own result. Batches run one at a time; items submitted meanwhile make
+    up the next one. If a batch fails, its items are
+    retried one by one so one bad item only fails its own request.
+    """
+
+    def __init__(
+        self, process: Callable[[List[Any]], List[Any]], executor: ThreadPoolExecutor,
+        max_wait: float, max_size: int,
+    ):
+        self.process = process
+        self.executor = executor
+        self.max_wait = max_wait
+        self.max_size = max_size
+        self.queue: Optional[asyncio.Queue] = None
+        self.task: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.items = 0
+
+    async def submit(self, item: Any) -> Any:
+        # Started lazily, on the event loop the requests are served from.
+        if self.task is None:
+            self.queue = asyncio.Queue()
+            self.task = asyncio.create_task(self.run())
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((item, future))
+        return await future
+
+    async def next_batch(self) -> List[Tuple[Any, asyncio.Future]]:
+        batch = [await self.queue.get()]
+        if self.max_wait > 0:
+            await asyncio.sleep(self.max_wait)
+        while len(batch) < self.max_size and not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+        return batch
+
+    async def flush(self, batch: List[Tuple[Any, asyncio.Future]]) -> None:
+        try:
+            results = await run_in_executor(self.executor, self.process, [item for item, _ in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                if not batch[0][1].done():
+                    batch[0][1].set_exception(e)
+                return
+            for entry in batch:
+                await self.flush([entry])
+            return
+        self.batches += 1
+        self.items += len(batch)
+        for (_, future), result in zip(batch, results):
+            if not future.done():  # the request may have been cancelled meanwhile
+                future.set_result(result)
+
+    async def run(self) -> None:
+        while True:
+            await self.flush(await self.next_batch())
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+            "queued": self.queue.qsize() if self.queue is not None else 0,
+        }
+
+
+class ScoringBatcher:
+    """
+    Batches the GPU work and similarity math of concurrent scoring requests: text embeddings
+    (queries and description-only checks), random check video embeddings and submission scores
+    each go through their own MicroBatcher, so under load one pass serves many requests.
+    """
+
+    def __init__(self, imagebind: ImageBind):
+        self.imagebind = imagebind
+        self.text = MicroBatcher(
+            lambda texts: list(imagebind.embed_text(texts).unsqueeze(1)),
+            GPU_EXECUTOR, config.SCORE_BATCH_WAIT, config.SCORE_BATCH_SIZE,
+        )
+        self.videos = MicroBatcher(
+            functools.partial(check_videos, imagebind),
+            GPU_EXECUTOR, config.SCORE_BATCH_WAIT, EMBED_BATCH_SIZE,
+        )
+        self.scores = MicroBatcher(
+            score_submissions,
+            CPU_EXECUTOR, config.SCORE_BATCH_WAIT, config.SCORE_BATCH_SIZE,
+        )
+
+    async def embed_text(self, text: str) -> torch.Tensor:
+        """The (1, d) embedding of the text."""
+        return await self.text.submit(text)
+
+    async def check_video(self, metadata: VideoMetadata, video_file: BinaryIO) -> bool:
+        # Decode first, so only forward passes queue on the GPU executor ahead of text embeddings.
+        inputs = await run_in_executor(IO_EXECUTOR, load_check_inputs, metadata, video_file)
+        return await self.videos.submit((metadata, inputs))
+
+    async def score(
+        self, embeddings: Embeddings, query_emb: torch.Tensor, match_scores: torch.Tensor, num_videos: int
+    ) -> dict:
+        """The scores of one submission, see score_submissions."""
+        return await self.scores.submit((embeddings, query_emb, match_scores, num_videos))
+
+    def stats(self) -> dict:
+        return {
+            "text": self.text.stats(),
+            "videos": self.videos.stats(),
+            "scores": self.scores.stats(),
+        }
+
+
+@functools.lru_cache(maxsize=None)
+def get_scoring_batcher(imagebind: ImageBind) -> ScoringBatcher:
+    return ScoringBatcher(imagebind)
+
+
 def metadata_check(metadata: List[VideoMetadata]) -> List[VideoMetadata]:
     return [
         video_metadata for video_metadata in metadata
@@ -127,126 +304,122 @@ async def get_random_video(metadata: List[VideoMetadata]) -> Optional[Tuple[Vide
 
 async def random_check(random_meta_and_vid: List[VideoMetadata], imagebind: ImageBind) -> bool:
     random_metadata, random_video = random_meta_and_vid
+    batcher = get_scoring_batcher(imagebind)
 
     if random_video is None:
-        desc_embeddings = await imagebind.embed_text_async([random_metadata.description])
-        return is_similar(desc_embeddings, random_metadata.description_emb)
+        _, _, description_emb = random_metadata.get_embeddings()
+        desc_embeddings = await batcher.embed_text(random_metadata.description)
+        return bool(is_similar(desc_embeddings, description_emb))
 
     # Video downloaded, check all embeddings
-    embeddings = await imagebind.embed_async([random_metadata.description], [random_video])
-    return (
-        is_similar(embeddings.video, random_metadata.video_emb) and
-        is_similar(embeddings.audio, random_metadata.audio_emb) and
-        is_similar(embeddings.description, random_metadata.description_emb)
-    )
+    return await batcher.check_video(random_metadata, random_video)
 
 
 async def get_num_unique_videos(videos: Videos) -> int:
     metadata = videos.video_metadata
-    embeddings = Embeddings(
-        video=torch.stack([torch.tensor(v.video_emb) for v in metadata]),
-        audio=torch.stack([torch.tensor(v.audio_emb) for v in metadata]),
-        description=torch.stack([torch.tensor(v.description_emb) for v in metadata]),
-    )
-    novelty_score, is_too_similar = compute_novelty_score(embeddings, already_uploaded=False)
+    _, embeddings = await run_in_executor(CPU_EXECUTOR, load_embeddings, metadata)
+    novelty_score, is_too_similar = await compute_novelty_score(embeddings, already_uploaded=False)
     return sum([not is_sim for is_sim in is_too_similar])
 
 
-async def score_videos_for_testing(videos: Videos, imagebind: ImageBind) -> float:
+async def score_videos_for_testing(videos: Videos, imagebind: ImageBind) -> dict:
     metadata = metadata_check(videos.video_metadata)
+    batcher = get_scoring_batcher(imagebind)
+    query_emb = await query_embedding_cache.get(videos.query, batcher.embed_text)
 
-    async with GPU_SEMAPHORE:
-        query_emb = await imagebind.embed_text_async([videos.query])
-
-    # Upload the videos to Pinecone and deduplicate
-    embeddings = Embeddings(
-        video=torch.stack([torch.tensor(v.video_emb) for v in metadata]).to(imagebind.device),
-        audio=torch.stack([torch.tensor(v.audio_emb) for v in metadata]).to(imagebind.device),
-        description=torch.stack([torch.tensor(v.description_emb) for v in metadata]).to(imagebind.device),
-    )
-    novelty_score, is_too_similar = compute_novelty_score(embeddings, already_uploaded=False)
-    embeddings = filter_embeddings(embeddings, is_too_similar)
-    metadata = [metadata for metadata, too_similar in zip(metadata, is_too_similar) if not too_similar]
-
-    # Compute relevance scores
-    description_relevance_scores = F.cosine_similarity(
-        embeddings.video, embeddings.description
-    ).tolist()
-    query_relevance_scores = F.cosine_similarity(
-        embeddings.video, query_emb
-    ).tolist()
-
-    # Aggregate scores
-    score = (
-        sum(description_relevance_scores) +
-        sum(query_relevance_scores) +
-        novelty_score
-    ) / 3 / videos.num_videos
-
-    score = max(score, 0.005)
-
-    return {
-        "is_unique": [not is_sim for is_sim in is_too_similar],
-        "description_relevance_scores": description_relevance_scores,
-        "query_relevance_scores": query_relevance_scores,
-        "novelty_score": novelty_score,
-        "score": score,
-    }
+    # Deduplicate against the vector store and score
+    _, embeddings = await run_in_executor(CPU_EXECUTOR, load_embeddings, metadata, imagebind.device)
+    match_scores = await NOVELTY_ENGINE.query_match_scores(embeddings, already_uploaded=False)
+    return await batcher.score(embeddings, query_emb, match_scores, videos.num_videos)
 
 
 async def score_and_upload_videos(videos: Videos, imagebind: ImageBind) -> float:
-    # Randomly check 1 video embedding
-    metadata = metadata_check(videos.video_metadata)
-    check_video = config.CHECK_PROBABILITY > random.random()
-    if check_video:
-        random_meta_and_vid = await get_random_video(metadata)
-        if random_meta_and_vid is None:
-            return -0.4
-
-    async with GPU_SEMAPHORE:
+    timer = StageTimer()
+    batcher = get_scoring_batcher(imagebind)
+    try:
+        # Randomly check 1 video embedding
+        metadata = metadata_check(videos.video_metadata)
+        check_video = config.CHECK_PROBABILITY > random.random()
         if check_video:
-            passed_check = await random_check(random_meta_and_vid, imagebind)
+            with timer.stage("download"):
+                random_meta_and_vid = await get_random_video(metadata)
+            if random_meta_and_vid is None:
+                return -0.4
+
+            with timer.stage("random_check"):
+                try:
+                    passed_check = await random_check(random_meta_and_vid, imagebind)
+                finally:
+                    if random_meta_and_vid[1] is not None:
+                        random_meta_and_vid[1].close()
             if not passed_check:
                 return -1.0
-        query_emb = await imagebind.embed_text_async([videos.query])
-
-    # Upload the videos to Pinecone and deduplicate
-    print(f"Received {len(metadata)} videos")
-    embeddings = Embeddings(
-        video=torch.stack([torch.tensor(v.video_emb) for v in metadata]).to(imagebind.device),
-        audio=torch.stack([torch.tensor(v.audio_emb) for v in metadata]).to(imagebind.device),
-        description=torch.stack([torch.tensor(v.description_emb) for v in metadata]).to(imagebind.device),
-    )
-    video_ids = upload_to_pinecone(embeddings, metadata)
-    novelty_score, is_too_similar = compute_novelty_score(embeddings, already_uploaded=True)
-    embeddings = filter_embeddings(embeddings, is_too_similar)
-    metadata = [metadata for metadata, too_similar in zip(metadata, is_too_similar) if not too_similar]
-    video_ids = [video_id for video_id, too_similar in zip(video_ids, is_too_similar) if not too_similar]
-    print(f"Filtered {len(videos.video_metadata)} videos down to {len(metadata)} videos")
-
-    # Compute relevance scores
-    description_relevance_scores = F.cosine_similarity(
-        embeddings.video, embeddings.description
-    ).tolist()
-    query_relevance_scores = F.cosine_similarity(
-        embeddings.video, query_emb
-    ).tolist()
-
-    # Aggregate scores
-    score = (
-        sum(description_relevance_scores) +
-        sum(query_relevance_scores) +
-        novelty_score
-    ) / 3 / videos.num_videos
-
-    # Schedule upload to HuggingFace
-    dataset_uploader.add_videos(
-        metadata,
-        video_ids,
-        description_relevance_scores,
-        query_relevance_scores,
-        videos.query,
-    )
-    score = max(score, 0.005)
 
-    return score
+        with timer.stage("query_embedding"):
+            query_emb = await query_embedding_cache.get(videos.query, batcher.embed_text)
+
+        # Upload the videos to the vector store and deduplicate
+        print(f"Received {len(metadata)} videos")
+        with timer.stage("load_embeddings"):
+            matrix, embeddings = await run_in_executor(CPU_EXECUTOR, load_embeddings, metadata, imagebind.device)
+        with timer.stage("upsert"):
+            video_ids = await run_in_executor(IO_EXECUTOR, upload_to_vector_store, embeddings, metadata)
+        with timer.stage("novelty"):
+            match_scores = await NOVELTY_ENGINE.query_match_scores(embeddings, already_uploaded=True)
+
+        # Compute relevance, novelty and the aggregate score
+        with timer.stage("score"):
+            scores = await batcher.score(embeddings, query_emb, match_scores, videos.num_videos)
+        is_unique = np.array(scores["is_unique"], dtype=bool)
+        matrix = matrix[is_unique]
+        metadata = [metadata for metadata, unique in zip(metadata, is_unique) if unique]
+        video_ids = [video_id for video_id, unique in zip(video_ids, is_unique) if unique]
+        print(f"Filtered {len(videos.video_metadata)} videos down to {len(metadata)} videos")
+
+        # Schedule upload to HuggingFace
+        with timer.stage("dataset"):
+            await run_in_executor(
+                IO_EXECUTOR,
+                dataset_uploader.add_videos,
+                metadata,
+                video_ids,
+                matrix,
+                scores["description_relevance_scores"],
+                scores["query_relevance_scores"],
+                videos.query,
+            )
+
+        return scores["score"]
+    finally:
+        STAGE_LATENCIES.record(timer)
+        print(f"Scoring stages: {timer}")
+
+
+async def score_response(videos: Videos, imagebind: ImageBind) -> Optional[float]:
+    """Scores one response of a batch under config.SCORE_RESPONSE_TIMEOUT; None if it fails or runs out of time."""
+    try:
+        return await asyncio.wait_for(score_and_upload_videos(videos, imagebind), timeout=config.SCORE_RESPONSE_TIMEOUT)
+    except asyncio.TimeoutError:
+        print(f"Scoring response in batch timed out after {config.SCORE_RESPONSE_TIMEOUT}s")
+    except Exception as e:
+        print(f"Error scoring response in batch: {e}")
+    return None
+
+
+async def score_and_upload_videos_batch(batch: VideosBatch, imagebind: ImageBind) -> List[Optional[float]]:
+    """
+    Scores every response to one query together: the query is embedded once up front and the
+    responses are then scored concurrently, sharing the GPU, download and vector store pools.
+    Each response has its own timeout, so a response that fails or stalls gets None without
+    holding up or failing the rest of the batch. The request takes at most twice
+    config.SCORE_RESPONSE_TIMEOUT: once for the query embedding, once for the responses.
+    """
+    try:
+        await asyncio.wait_for(
+            query_embedding_cache.get(batch.query, get_scoring_batcher(imagebind).embed_text),
+            timeout=config.SCORE_RESPONSE_TIMEOUT,
+        )
+    except Exception as e:
+        # Not fatal: each response embeds the query again if it is still missing from the cache.
+        print(f"Error embedding batch query: {e!r}")
+    return list(await asyncio.gather(*[score_response(videos, imagebind) for videos in batch.to_videos()]))
@@ -0,0 +1,89 @@
+from typing import List, Tuple
+
+import torch
+import torch.nn.functional as F
+
+
+DIFFERENCE_THRESHOLD = 0.05
+MIN_SCORE = 0.005
+
+
+class KernelScores:
+    """Output of score_kernel for B submissions of up to n videos each; everything is a tensor."""
+
+    def __init__(
+        self, description_relevance: torch.Tensor, query_relevance: torch.Tensor, novelty: torch.Tensor,
+        is_too_similar: torch.Tensor, novelty_scores: torch.Tensor, scores: torch.Tensor,
+    ):
+        self.description_relevance = description_relevance  # (B, n)
+        self.query_relevance = query_relevance  # (B, n)
+        self.novelty = novelty  # (B, n)
+        self.is_too_similar = is_too_similar  # (B, n) bool, false for padding
+        self.novelty_scores = novelty_scores  # (B,) summed novelty of the videos kept
+        self.scores = scores  # (B,)
+
+
+def pad_submissions(tensors: List[torch.Tensor], padding_value: float = 0.0) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Stacks per-submission (n_i, ...) tensors into one (B, max n_i, ...) tensor padded with
+    `padding_value`, and returns it with the (B, max n_i) mask of real (not padding) rows.
+    """
+    padded = torch.nn.utils.rnn.pad_sequence(tensors, batch_first=True, padding_value=padding_value)
+    lengths = torch.tensor([len(tensor) for tensor in tensors], device=padded.device)
+    mask = torch.arange(padded.shape[1], device=padded.device) < lengths.unsqueeze(1)
+    return padded, mask
+
+
+def compute_novelty(match_scores: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Novelty (the complement of the similarity of the closest match in the index) and the
+    too-similar mask, for match scores of any shape. A NaN match score marks a lookup that
+    timed out: it counts as not novel, but does not mark the video as a duplicate.
+    """
+    timed_out = torch.isnan(match_scores)
+    novelty = torch.where(timed_out, torch.zeros_like(match_scores), 1 - match_scores)
+    is_too_similar = ~timed_out & (novelty < DIFFERENCE_THRESHOLD)
+    return novelty, is_too_similar
+
+
+def relevance_kernel(
+    video: torch.Tensor, description: torch.Tensor, query: torch.Tensor
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """(B, n) description and query relevance of (B, n, d) video embeddings, for (B, d) queries."""
+    description_relevance = F.cosine_similarity(video, description, dim=-1)
+    query_relevance = F.cosine_similarity(video, query.unsqueeze(1), dim=-1)
+    return description_relevance, query_relevance
+
+
+def score_kernel(
+    video: torch.Tensor, description: torch.Tensor, query: torch.Tensor,
+    match_scores: torch.Tensor, mask: torch.Tensor, num_videos: torch.Tensor,
+) -> KernelScores:
+    """
+    Scores B submissions at once, on whichever device the inputs are on.
+
+    - video, description: (B, n, d) embeddings, padded past the end of each submission
+    - query: (B, d) embeddings of the query each submission answers
+    - match_scores: (B, n) similarity of each video's closest match in the index, NaN on timeout
+    - mask: (B, n), true for real videos and false for padding
+    - num_videos: (B,) number of videos each submission was asked for
+
+    Videos too similar to one already in the index are left out of every sum. A submission
+    scores its summed description relevance, query relevance and novelty, averaged over the
+    three and over the requested videos, and floored at MIN_SCORE.
+    """
+    description_relevance, query_relevance = relevance_kernel(video, description, query)
+    novelty, is_too_similar = compute_novelty(match_scores)
+    is_too_similar = is_too_similar & mask
+    kept = (mask & ~is_too_similar).to(description_relevance.dtype)
+    novelty_scores = (novelty * kept).sum(dim=1)
+    relevance_scores = ((description_relevance + query_relevance) * kept).sum(dim=1)
+    scores = (relevance_scores + novelty_scores) / 3 / num_videos.to(description_relevance.dtype)
+    return KernelScores(
+        description_relevance=description_relevance,
+        query_relevance=query_relevance,
+        novelty=novelty,
+        is_too_similar=is_too_similar,
+        novelty_scores=novelty_scores,
+        scores=scores.clamp(min=MIN_SCORE),
+    )
@@ -0,0 +1,45 @@
+import contextlib
+import time
+from collections import defaultdict, deque
+from typing import Deque, Dict
+
+
+class StageTimer:
+    """Wall-clock seconds spent in each named stage of a single request."""
+
+    def __init__(self):
+        self.durations: Dict[str, float] = {}
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.durations[name] = self.durations.get(name, 0.0) + time.perf_counter() - start
+
+    def __str__(self) -> str:
+        return ", ".join(f"{name}={duration:.3f}s" for name, duration in self.durations.items())
+
+
+class StageLatencies:
+    """Rolling window of per-stage latencies across requests, summarized as percentiles."""
+
+    def __init__(self, window: int = 1000):
+        self.samples: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=window))
+
+    def record(self, timer: StageTimer) -> None:
+        for name, duration in timer.durations.items():
+            self.samples[name].append(duration)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        summary = {}
+        for name, samples in self.samples.items():
+            ordered = sorted(samples)
+            summary[name] = {
+                "count": len(ordered),
+                "p50": ordered[int(0.50 * (len(ordered) - 1))],
+                "p99": ordered[int(0.99 * (len(ordered) - 1))],
+                "max": ordered[-1],
+            }
+        return summary
@@ -0,0 +1,303 @@
+import json
+import os
+import threading
+import time
+from typing import List, Optional
+
+import numpy as np
+
+from validator_api import config
+
+
+class VectorStore:
+    """
+    Index of uploaded video embeddings used for deduplication. Implements the subset of the
+    Pinecone Index API that the validator API uses: `upsert(vectors=[{"id", "values", "metadata"}])`
+    and `query(vector=..., top_k=...)` returning cosine-scored `{"matches": [{"id", "score"}]}`.
+    """
+
+    def upsert(self, vectors: List[dict], **kwargs) -> dict:
+        raise NotImplementedError
+
+    def query(self, vector: List[float], top_k: int, **kwargs) -> dict:
+        raise NotImplementedError
+
+
+class PineconeVectorStore(VectorStore):
+    def __init__(self, api_key: str, index_name: str):
+        from pinecone import Pinecone
+        self.index = Pinecone(api_key=api_key).Index(index_name)
+
+    def upsert(self, vectors: List[dict], **kwargs) -> dict:
+        return self.index.upsert(vectors=vectors, **kwargs)
+
+    def query(self, vector: List[float], top_k: int, **kwargs) -> dict:
+        return self.index.query(vector=vector, top_k=top_k, **kwargs)
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+    if len(scores) > top_k:
+        candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates])]
+
+
+def spherical_kmeans(vectors: np.ndarray, nlist: int, iterations: int, seed: int = 0) -> np.ndarray:
+    """Cluster unit vectors by cosine similarity, returning (nlist, dim) unit centroids."""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), nlist, replace=False)]
+    for _ in range(iterations):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        empty = np.bincount(assignments, minlength=nlist) == 0
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()), replace=False)]
+        centroids = normalize(sums)
+    return centroids
+
+
+class InMemoryVectorStore(VectorStore):
+    """
+    Brute-force, in-process stand-in for the Pinecone index, so novelty scoring can be run and
+    benchmarked offline. `latency` adds an artificial round-trip delay to every call.
+    """
+
+    def __init__(self, dim: int = 1024, latency: float = 0.0):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.ids: List[str] = []
+        self.vectors = np.empty((0, dim), dtype=np.float32)
+
+    def upsert(self, vectors: List[dict], **kwargs) -> dict:
+        time.sleep(self.latency)
+        values = normalize(np.asarray([v["values"] for v in vectors], dtype=np.float32))
+        with self.lock:
+            self.ids.extend(v["id"] for v in vectors)
+            self.vectors = np.concatenate([self.vectors, values])
+        return {"upserted_count": len(vectors)}
+
+    def query(self, vector: List[float], top_k: int, **kwargs) -> dict:
+        time.sleep(self.latency)
+        with self.lock:
+            ids, stored = self.ids, self.vectors
+        scores = stored @ normalize(np.asarray(vector, dtype=np.float32))
+        return {"matches": [
+            {"id": ids[i], "score": float(scores[i])}
+            for i in top_k_indices(scores, top_k)
+        ]}
+
+
+class LocalVectorStore(VectorStore):
+    """
+    Single-box IVF (inverted file) index over memory-mapped float16 or float32 unit vectors.
+
+    Vectors are appended to `vectors.bin` as they are upserted. Until `train_size` vectors are
+    stored every query is an exact scan; after that a spherical k-means quantizer with `nlist`
+    cells is trained once, each vector is filed under its nearest centroid, and a query only
+    scores the vectors in its `nprobe` closest cells. Training runs on a background thread and
+    the quantizer is swapped in when it is done, so queries keep scanning meanwhile. Everything needed to reopen the index
+    (vectors, cell assignments, centroids, ids) is persisted under `path`.
+    """
+
+    SCAN_CHUNK = 65536
+
+    def __init__(
+        self, path: str, dim: int = 1024, dtype: str = "float16",
+        nlist: int = 1024, nprobe: int = 8, train_size: int = 65536, kmeans_iterations: int = 10,
+    ):
+        self.path = path
+        self.nprobe = nprobe
+        self.train_size = train_size
+        self.kmeans_iterations = kmeans_iterations
+        self.lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+
+        meta_path = os.path.join(path, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+        else:
+            meta = {"dim": dim, "dtype": dtype, "nlist": nlist, "count": 0, "capacity": 0}
+        self.dim = meta["dim"]
+        self.dtype = np.dtype(meta["dtype"])
+        self.nlist = meta["nlist"]
+        self.count = meta["count"]
+        self.capacity = meta["capacity"]
+
+        self.vectors: Optional[np.memmap] = None
+        self.assignments: Optional[np.memmap] = None
+        if self.capacity > 0:
+            self.open_arrays()
+
+        lines = []
+        if os.path.exists(self.file("ids.txt")):
+            with open(self.file("ids.txt")) as f:
+                lines = f.readlines()
+        if len(lines) > self.count:
+            # Drop ids written by an upsert that crashed before its meta.json update.
+            lines = lines[:self.count]
+            with open(self.file("ids.txt"), "w") as f:
+                f.writelines(lines)
+        self.ids: List[str] = [line.split("\t", 1)[0] for line in lines]
+
+        self.centroids: Optional[np.ndarray] = None
+        self.cells: List[np.ndarray] = []
+        self.training: Optional[threading.Thread] = None
+        centroids_path = os.path.join(path, "centroids.npy")
+        if os.path.exists(centroids_path):
+            self.centroids = np.load(centroids_path)
+            self.build_cells()
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    def file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def open_arrays(self) -> None:
+        self.vectors = np.memmap(self.file("vectors.bin"), dtype=self.dtype, mode="r+", shape=(self.capacity, self.dim))
+        self.assignments = np.memmap(self.file("assignments.bin"), dtype=np.int32, mode="r+", shape=(self.capacity,))
+
+    def reserve(self, needed: int) -> None:
+        if needed <= self.capacity:
+            return
+        capacity = max(needed, 2 * self.capacity, 1024)
+        self.vectors = self.assignments = None  # release the old maps before resizing the files
+        for name, row_bytes in (("vectors.bin", self.dim * self.dtype.itemsize), ("assignments.bin", 4)):
+            with open(self.file(name), "ab") as f:
+                f.truncate(capacity * row_bytes)
+        self.capacity = capacity
+        self.open_arrays()
+
+    def write_rows(self, name: str, start: int, rows: np.ndarray) -> None:
+        """
+        Writes `rows` from row `start` of the file on. The write goes to the page cache the
+        memory maps share, so only these rows are written out, not the whole map as with flush().
+        """
+        with open(self.file(name), "r+b") as f:
+            os.pwrite(f.fileno(), np.ascontiguousarray(rows).tobytes(), start * (rows.nbytes // len(rows)))
+
+    def save_meta(self) -> None:
+        tmp_path = self.file("meta.json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({
+                "dim": self.dim, "dtype": self.dtype.name, "nlist": self.nlist,
+                "count": self.count, "capacity": self.capacity,
+            }, f)
+        os.replace(tmp_path, self.file("meta.json"))
+
+    def build_cells(self) -> None:
+        assignments = np.asarray(self.assignments[:self.count])
+        order = np.argsort(assignments, kind="stable")
+        bounds = np.searchsorted(assignments[order], np.arange(self.nlist + 1))
+        self.cells = [order[bounds[i]:bounds[i + 1]] for i in range(self.nlist)]
+
+    def assign(self, vectors: np.ndarray, start: int, end: int, centroids: np.ndarray) -> np.ndarray:
+        """Nearest centroid of each of rows [start, end) of `vectors`."""
+        assignments = np.empty(end - start, dtype=np.int32)
+        for i in range(start, end, self.SCAN_CHUNK):
+            chunk = np.asarray(vectors[i:min(i + self.SCAN_CHUNK, end)], dtype=np.float32)
+            assignments[i - start:i - start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+        return assignments
+
+    def train(self) -> None:
+        """
+        Trains the quantizer and files the stored vectors under it without holding the lock,
+        then, under the lock, files the vectors upserted meanwhile and swaps the quantizer in.
+        """
+        start = time.time()
+        with self.lock:
+            # reserve() only ever grows the file, so this map stays valid for the first `count` rows.
+            vectors, count = self.vectors, self.count
+        rng = np.random.default_rng(0)
+        sample = np.sort(rng.choice(count, min(count, self.train_size), replace=False))
+        centroids = spherical_kmeans(
+            np.asarray(vectors[sample], dtype=np.float32), self.nlist, self.kmeans_iterations
+        )
+        assignments = self.assign(vectors, 0, count, centroids)
+        with self.lock:
+            assignments = np.concatenate([assignments, self.assign(self.vectors, count, self.count, centroids)])
+            if len(assignments) > 0:
+                self.write_rows("assignments.bin", 0, assignments)
+            np.save(self.file("centroids.npy"), centroids)
+            self.centroids = centroids
+            self.build_cells()
+        print(f"Trained local vector index with {self.nlist} cells on {len(sample)} vectors in {time.time() - start:.2f}s")
+
+    def upsert(self, vectors: List[dict], **kwargs) -> dict:
+        if len(vectors) == 0:
+            return {"upserted_count": 0}
+        values = normalize(np.asarray([v["values"] for v in vectors], dtype=np.float32))
+        with self.lock:
+            start, end = self.count, self.count + len(vectors)
+            self.reserve(end)
+            self.write_rows("vectors.bin", start, values.astype(self.dtype))
+            if self.trained:
+                assignments = np.argmax(values @ self.centroids.T, axis=1).astype(np.int32)
+                self.write_rows("assignments.bin", start, assignments)
+                for cell in np.unique(assignments):
+                    new_rows = np.arange(start, end)[assignments == cell]
+                    self.cells[cell] = np.concatenate([self.cells[cell], new_rows])
+            with open(self.file("ids.txt"), "a") as f:
+                f.writelines(f"{v['id']}\t{v.get('metadata', {}).get('youtube_id', '')}\n" for v in vectors)
+            self.ids.extend(v["id"] for v in vectors)
+            self.count = end
+            self.save_meta()
+            if not self.trained and self.training is None and self.count >= self.train_size:
+                self.training = threading.Thread(target=self.train, name="vector-index-train", daemon=True)
+                self.training.start()
+        return {"upserted_count": len(vectors)}
+
+    def candidate_rows(
+        self, query: np.ndarray, centroids: Optional[np.ndarray], cells: List[np.ndarray]
+    ) -> Optional[np.ndarray]:
+        """Rows to score for the query, or None to scan everything."""
+        if centroids is None:
+            return None
+        cell_scores = centroids @ query
+        probe = top_k_indices(cell_scores, min(self.nprobe, self.nlist))
+        return np.sort(np.concatenate([cells[cell] for cell in probe]))
+
+    def query(self, vector: List[float], top_k: int, **kwargs) -> dict:
+        query = normalize(np.asarray(vector, dtype=np.float32))
+        # Score a snapshot outside the lock, so queries run in parallel and do not hold up upserts.
+        # Rows below `count` never change, and reserve() only grows the file under the old map.
+        with self.lock:
+            count, vectors, ids = self.count, self.vectors, self.ids
+            centroids, cells = self.centroids, list(self.cells)
+        if count == 0:
+            return {"matches": []}
+        rows = self.candidate_rows(query, centroids, cells)
+        if rows is None:
+            scores = np.concatenate([
+                np.asarray(vectors[i:min(i + self.SCAN_CHUNK, count)], dtype=np.float32) @ query
+                for i in range(0, count, self.SCAN_CHUNK)
+            ])
+            rows = np.arange(count)
+        else:
+            scores = np.asarray(vectors[rows], dtype=np.float32) @ query
+        best = top_k_indices(scores, top_k)
+        return {"matches": [
+            {"id": ids[rows[i]], "score": float(scores[i])}
+            for i in best
+        ]}
+
+
+def get_vector_store() -> VectorStore:
+    if config.VECTOR_STORE == "memory":
+        return InMemoryVectorStore()
+    if config.VECTOR_STORE == "local":
+        return LocalVectorStore(
+            config.LOCAL_INDEX_PATH,
+            dtype=config.LOCAL_INDEX_DTYPE,
+            nlist=config.LOCAL_INDEX_NLIST,
+            nprobe=config.LOCAL_INDEX_NPROBE,
+        )
+    return PineconeVectorStore(config.PINECONE_API_KEY, config.PINECONE_INDEX)